@@ -2,18 +2,185 @@
 # Calvin Pelletier
 # 1/21/16
 
+# statistics of the characteristics of many melodies, computed in one pass over any iterable of melodies (a generator
+# works, the melodies are never kept) so memory use doesn't depend on how many there are
+# every accumulator can be merged with another one of the same kind, so separate processes can each take a share of
+# the melodies and combine their results
+
 import math
+from random import Random
 
 def analyze_characteristics(melodies):
-    characteristics = {}
+    stats = characteristic_stats(melodies)
+    for key, value in stats.iteritems():
+        print("%s avg: %f\n%s std_dev: %f\n" % (key, value.mean, key, value.std_dev()))
+
+# dict of characteristic -> CharacteristicStats
+def characteristic_stats(melodies):
+    ret = {}
     for m in melodies:
         for key, value in m.characteristics.iteritems():
-            if characteristics.has_key(key):
-                characteristics[key].append(value)
-            else:
-                characteristics[key] = [value]
-    for key, value in characteristics.iteritems():
-        print("%s avg: %f\n%s std_dev: %f\n" % (key, average(value), key, std_dev(value)))
+            if not ret.has_key(key):
+                ret[key] = CharacteristicStats()
+            ret[key].add(value)
+    return ret
+
+def merge_characteristic_stats(a, b):
+    ret = dict(a)
+    for key, value in b.iteritems():
+        if ret.has_key(key):
+            ret[key] = ret[key].merged(value)
+        else:
+            ret[key] = value
+    return ret
+
+# everything kept about one characteristic
+class CharacteristicStats:
+    def __init__(self):
+        self.running = RunningStats()
+        self.quantiles = QuantileSketch()
+        self.histogram = Histogram()
+
+    def add(self, x):
+        self.running.add(x)
+        self.quantiles.add(x)
+        self.histogram.add(x)
+
+    def merged(self, other):
+        ret = CharacteristicStats()
+        ret.running = self.running.merged(other.running)
+        ret.quantiles = self.quantiles.merged(other.quantiles)
+        ret.histogram = self.histogram.merged(other.histogram)
+        return ret
+
+    @property
+    def mean(self):
+        return self.running.mean
+
+    def std_dev(self):
+        return self.running.std_dev()
+
+    def quantile(self, q):
+        return self.quantiles.quantile(q)
+
+# count, mean, variance (welford's method), min and max
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared differences from the mean
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    # chan et al.'s formula for combining two sets of moments
+    def merged(self, other):
+        ret = RunningStats()
+        ret.count = self.count + other.count
+        if ret.count == 0:
+            return ret
+        delta = other.mean - self.mean
+        ret.mean = self.mean + delta * other.count / float(ret.count)
+        ret.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / float(ret.count)
+        ret.min = min(x for x in [self.min, other.min] if x is not None)
+        ret.max = max(x for x in [self.max, other.max] if x is not None)
+        return ret
+
+    # population variance, like std_dev() below
+    def variance(self):
+        if self.count == 0:
+            return 0.0
+        return self.m2 / self.count
+
+    def std_dev(self):
+        return math.sqrt(self.variance())
+
+# approximate quantiles in bounded memory (a kll style sketch): values go into level 0, a level that fills up is
+# sorted and every other value (starting at a random one of the first two) moves up a level, where it counts twice as
+# much
+# with the default size the rank of a quantile is off by well under 1% of the count
+class QuantileSketch:
+    def __init__(self, size=200, seed=0):
+        self.size = size
+        self.levels = [[]]
+        self.rng = Random(seed)
+
+    def add(self, x):
+        self.levels[0].append(x)
+        if len(self.levels[0]) >= self.size:
+            self.compact()
+
+    def compact(self):
+        for level in range(len(self.levels)):
+            if len(self.levels[level]) >= self.size:
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                values = sorted(self.levels[level])
+                self.levels[level + 1].extend(values[self.rng.randint(0, 1)::2])
+                self.levels[level] = []
+
+    def merged(self, other):
+        ret = QuantileSketch(self.size)
+        ret.rng = Random(self.rng.random())
+        ret.levels = [[] for i in range(max(len(self.levels), len(other.levels)))]
+        for sketch in [self, other]:
+            for level, values in enumerate(sketch.levels):
+                ret.levels[level].extend(values)
+        ret.compact()
+        return ret
+
+    # value with a fraction q (0 to 1) of the values at or below it
+    def quantile(self, q):
+        weighted = []
+        for level, values in enumerate(self.levels):
+            for x in values:
+                weighted.append((x, 1 << level))
+        if len(weighted) == 0:
+            return None
+        weighted.sort()
+        total = sum(weight for x, weight in weighted)
+        seen = 0
+        for x, weight in weighted:
+            seen += weight
+            if seen >= q * total:
+                return x
+        return weighted[-1][0]
+
+# counts of values in equal width bins from lower to upper, plus counts below and above the range
+class Histogram:
+    def __init__(self, lower=0.0, upper=100.0, bins=100):
+        self.lower = lower
+        self.upper = upper
+        self.counts = [0] * bins
+        self.below = 0
+        self.above = 0
+
+    def add(self, x):
+        if x < self.lower:
+            self.below += 1
+        elif x >= self.upper:
+            self.above += 1
+        else:
+            i = int((x - self.lower) / (self.upper - self.lower) * len(self.counts))
+            self.counts[min(i, len(self.counts) - 1)] += 1
+
+    def merged(self, other):
+        if (self.lower, self.upper, len(self.counts)) != (other.lower, other.upper, len(other.counts)):
+            raise NameError("Can't merge histograms with different bins.")
+        ret = Histogram(self.lower, self.upper, len(self.counts))
+        ret.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        ret.below = self.below + other.below
+        ret.above = self.above + other.above
+        return ret
 
 def average(data):
     total = 0.0
@@ -0,0 +1,213 @@
+# batch.py
+
+# scores a whole population of melodies at once
+# melodies with the same duration are packed into numpy arrays (one row per melody, one column per tick) and all
+# nine characteristics (or the ones asked for) are computed with array operations instead of walking every melody's notes in python
+# every sum is accumulated left to right, in the same order as the Melody.get_* functions (or in integer units, see
+# measures.py), so the results are identical to calling calculate_characteristics() on each melody
+
+import numpy
+import note
+import chord
+import repeats
+import measures
+
+# chords in the order of the rows of the dissonance matrix
+NUMERALS = chord.NUMERALS
+NUMERAL_INDEX = chord.NUMERAL_INDEX
+
+# row = chord, column = degree - 1
+CHORD_DISSONANCE = chord.DISSONANCE_MATRIX
+
+class Batch:
+    def __init__(self, melodies):
+        self.melodies = melodies
+        rows = len(melodies)
+        ticks = melodies[0].duration()
+        self.kind = numpy.zeros((rows, ticks), dtype=numpy.int8)
+        self.pitch = numpy.zeros((rows, ticks), dtype=numpy.int32) # exact degree of the sounding note, 0 if silent
+        self.duration = numpy.zeros((rows, ticks), dtype=numpy.int32) # duration of the note or rest the tick is part of
+        self.chord = numpy.zeros((rows, ticks), dtype=numpy.int32) # index into NUMERALS
+        self.minor = numpy.zeros(rows, dtype=numpy.int32)
+        self.rhythmic_style = numpy.zeros(rows, dtype=numpy.int32)
+        for row, m in enumerate(melodies):
+            if m.duration() != ticks:
+                raise NameError("All melodies in a batch must have the same duration.")
+            self.kind[row] = numpy.frombuffer(m.kinds, dtype=numpy.int8)
+            self.pitch[row] = numpy.frombuffer(m.pitches, dtype=numpy.int8)
+            self.duration[row] = numpy.frombuffer(m.durations, dtype=numpy.uint16)
+            self.chord[row] = chord_indices(m.chord_progression, ticks)
+            self.minor[row] = int(m.minor)
+            self.rhythmic_style[row] = m.rhythmic_style
+
+def chord_indices(chord_progression, ticks):
+    return chord_progression.compile().chord_indices(ticks)
+
+# keys is a list of the characteristics to calculate, all of them if it's None
+def calculate_characteristics(melodies, keys=None):
+    groups = {}
+    for m in melodies:
+        groups.setdefault(m.duration(), []).append(m)
+    for group in groups.itervalues():
+        b = Batch(group)
+        results = characteristics(b, group[0].__class__, keys)
+        for row, m in enumerate(group):
+            for key, values in results.iteritems():
+                m.characteristics[key] = float(values[row])
+
+# returns a dict of characteristic name -> array with one value per melody in the batch
+# constants are read from the melody class so that subclasses can override them
+def characteristics(b, cls, keys=None):
+    if keys is None:
+        keys = KEYS
+    ret = {}
+    for key in keys:
+        ret[key] = FUNCTIONS[key](b, cls)
+    return ret
+
+# CHARACTERISTIC FUNCTIONS
+def energetic(b, cls):
+    onset = b.kind == note.NOTE
+    rows, cols = numpy.nonzero(onset)
+    pitch = b.pitch[rows, cols]
+    duration = b.duration[rows, cols]
+    # a note and the one after it are only neighbors if they are in the same melody
+    values = numpy.zeros(b.kind.shape)
+    same = rows[1:] == rows[:-1]
+    values[rows[:-1][same], cols[:-1][same]] = numpy.abs(pitch[1:] - pitch[:-1])[same] / duration[:-1][same].astype(float)
+    return _per_note(cls.EN_A * _ordered_sum(values), onset, cls.EN_B)
+
+def progression_dissonant(b, cls):
+    values = numpy.where(b.pitch > 0, CHORD_DISSONANCE[b.chord, (b.pitch - 1) % 7] * b.duration, 0.0)
+    return _per_note(cls.PD_A * _ordered_sum(values), b.kind == note.NOTE, cls.PD_B)
+
+def key_dissonant(b, cls):
+    table = numpy.array([cls.KEY_DISSONANCE_MAJOR, cls.KEY_DISSONANCE_MINOR])
+    onset = b.kind == note.NOTE
+    values = numpy.where(onset, table[b.minor[:, None], (b.pitch - 1) % 7] * b.duration, 0.0)
+    return _per_note(cls.KD_A * _ordered_sum(values), onset, cls.KD_B)
+
+def rhythmic(b, cls):
+    table = numpy.array(cls.RHYTHMIC_STYLE)
+    beat = numpy.arange(b.kind.shape[1]) % 8
+    values = numpy.where(b.kind == note.NOTE, table[b.rhythmic_style[:, None], beat[None, :]] * b.duration, 0.0)
+    return cls.RH_A * _ordered_sum(values) / float(b.kind.shape[1]) + cls.RH_B
+
+def rhythmically_thematic(b, cls):
+    units = _measure_bonus(b.kind == note.NOTE, 1, measures.rhythm_mismatch, measures.RHYTHM_BONUS)
+    total = units / measures.RHYTHM_UNIT
+    return cls.RT_A * total / float(_measures(b.kind.shape[1])) + cls.RT_B
+
+def tonally_thematic(b, cls):
+    ret = numpy.zeros(b.kind.shape[0])
+    for row in range(b.kind.shape[0]):
+        pitches = b.pitch[row][b.kind[row] == note.NOTE].tolist()
+        if len(pitches) != 0:
+            ret[row] = cls.TT_A * repeats.repeated_sequences(pitches) / float(len(pitches)) + cls.TT_B
+    return ret
+
+def repetitive(b, cls):
+    codes = numpy.where(b.kind == note.EXTENSION, b.pitch + measures.EXTENSION_CODE, b.pitch)
+    codes[b.pitch == 0] = 0
+    units = _measure_bonus(codes, measures.TICK_BITS, measures.pitch_mismatch, measures.PITCH_BONUS)
+    total = units / measures.PITCH_UNIT
+    return cls.RE_A * total / float(_measures(b.kind.shape[1])) + cls.RE_B
+
+def dense(b, cls):
+    return cls.DE_A * numpy.count_nonzero(b.kind == note.NOTE, axis=1) / float(b.kind.shape[1]) + cls.DE_B
+
+def silent(b, cls):
+    return cls.SI_A * numpy.count_nonzero(b.pitch == 0, axis=1) / float(b.kind.shape[1]) + cls.SI_B
+
+KEYS = ['en', 'pd', 'kd', 'rh', 'rt', 'tt', 're', 'de', 'si']
+FUNCTIONS = {}
+FUNCTIONS['en'] = energetic
+FUNCTIONS['pd'] = progression_dissonant
+FUNCTIONS['kd'] = key_dissonant
+FUNCTIONS['rh'] = rhythmic
+FUNCTIONS['rt'] = rhythmically_thematic
+FUNCTIONS['tt'] = tonally_thematic
+FUNCTIONS['re'] = repetitive
+FUNCTIONS['de'] = dense
+FUNCTIONS['si'] = silent
+
+# MELODY x PROGRESSION FUNCTIONS
+# the only characteristic that depends on the chord progression is pd, so auditioning melodies over many progressions
+# only needs pd for every pair
+
+# matrix[i][j] is the pd of melodies[i] played over progressions[j] (the progression the melody has is ignored)
+def progression_dissonance_matrix(melodies, progressions):
+    MAX_VALUES = 1 << 22 # values computed at once, limits memory use
+
+    ret = numpy.zeros((len(melodies), len(progressions)))
+    if len(melodies) == 0 or len(progressions) == 0:
+        return ret
+    cls = melodies[0].__class__
+    compiled = [p.compile() for p in progressions]
+    groups = {}
+    for i, m in enumerate(melodies):
+        groups.setdefault(m.duration(), []).append(i)
+    for ticks, rows in groups.iteritems():
+        b = Batch([melodies[i] for i in rows])
+        chords = numpy.array([c.chord_indices(ticks) for c in compiled])
+        degrees = (b.pitch - 1) % 7
+        sounding = b.pitch > 0
+        notes = numpy.count_nonzero(b.kind == note.NOTE, axis=1)[:, numpy.newaxis]
+        step = max(1, MAX_VALUES // max(1, len(rows) * ticks))
+        for start in range(0, len(compiled), step):
+            # melody x progression x tick
+            values = CHORD_DISSONANCE[chords[numpy.newaxis, start:start + step], degrees[:, numpy.newaxis, :]]
+            values = numpy.where(sounding[:, numpy.newaxis, :], values * b.duration[:, numpy.newaxis, :], 0.0)
+            totals = cls.PD_A * _ordered_sum(values)
+            ret[rows, start:start + step] = numpy.where(notes == 0, 0.0, totals / numpy.maximum(notes, 1).astype(float)
+                                                        + cls.PD_B)
+    return ret
+
+# for every melody, the indices of progressions from the best fit (least dissonant) to the worst, ties in the order
+# given
+def rank_progressions(melodies, progressions):
+    return numpy.argsort(progression_dissonance_matrix(melodies, progressions), axis=1, kind='mergesort')
+
+# OTHER FUNCTIONS
+# sums along the last axis strictly left to right, the same way a python for loop would
+def _ordered_sum(values):
+    if values.shape[-1] == 0:
+        return numpy.zeros(values.shape[:-1])
+    return numpy.cumsum(values, axis=-1)[..., -1]
+
+# melodies without any notes score 0.0
+def _per_note(scaled_total, onset, offset):
+    notes = numpy.count_nonzero(onset, axis=1)
+    return numpy.where(notes == 0, 0.0, scaled_total / numpy.maximum(notes, 1).astype(float) + offset)
+
+def _measures(ticks):
+    if ticks % 8 != 0:
+        raise NameError("Melody duration is not a whole number of measures.")
+    return ticks // 8
+
+# sum of the bonuses (see measures.py) for every pair of measures of every row, in integer units
+# rows are compared a chunk at a time so the measure x measure x tick array stays under MAX_VALUES, rows too long for
+# even one of those are encoded as measure signatures (bits per tick) and grouped instead, like Melody.get_rt/get_re
+def _measure_bonus(values, bits, mismatch, bonus):
+    MAX_VALUES = 1 << 22 # values compared at once, limits memory use
+
+    rows = values.shape[0]
+    count = _measures(values.shape[1])
+    grouped = values.reshape(rows, count, 8)
+    table = numpy.array(bonus, dtype=numpy.int64)
+    ret = numpy.zeros(rows, dtype=numpy.int64)
+    per_row = count * count * 8
+    if per_row <= MAX_VALUES:
+        i, j = numpy.triu_indices(count, 1)
+        step = max(1, MAX_VALUES // per_row)
+        for start in range(0, rows, step):
+            chunk = grouped[start:start + step]
+            mismatches = numpy.count_nonzero(chunk[:, :, None, :] != chunk[:, None, :, :], axis=3)
+            ret[start:start + step] = table[mismatches[:, i, j]].sum(axis=1)
+    else:
+        shifts = numpy.arange(8, dtype=numpy.int64) * bits
+        signatures = (grouped.astype(numpy.int64) << shifts).sum(axis=2)
+        for row in range(rows):
+            histogram = measures.mismatch_histogram(signatures[row].tolist(), mismatch)
+            ret[row] = measures.bonus_units(histogram, bonus)
+    return ret
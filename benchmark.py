@@ -0,0 +1,451 @@
+# benchmark.py
+
+# timings for the hot paths
+# usage: python benchmark.py <name>
+#        python benchmark.py suite [results file] [baseline file]
+
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from random import randint, random, seed
+import melody
+import note
+import progression
+import batch
+import i_o
+import midi
+import pool
+import repeats
+
+# the original get_tonally_thematic, hashes every sequence of notes as a string
+def naive_repeated_sequences(m):
+    total = 0.0
+    sequences = {}
+    notes = []
+    for n in m.notes:
+        notes.append(n.name_with_octave)
+    for i in range(len(notes) - 1):
+        for j in range(i + 2, len(notes) + 1):
+            sequence = '-'.join(notes[i:j])
+            if sequences.has_key(sequence):
+                sequences[sequence] += 1
+            else:
+                sequences[sequence] = 1
+    for key, value in sequences.iteritems():
+        if value > 1:
+            if len(set(key.split('-'))) != 1:
+                total += float(value)
+    return total
+
+def tonally_thematic():
+    MEASURES = [4, 8, 16, 32, 64, 128, 256]
+    NAIVE_MAX_MEASURES = 128 # the naive version runs out of memory past this
+    REPEATS = 5
+
+    seed(0)
+    print("measures\tnotes\tnaive (ms)\tsuffix array (ms)")
+    for measures in MEASURES:
+        melodies = [melody.create_random_melody(measures=measures) for i in range(REPEATS)]
+        notes = sum(len(m.notes) for m in melodies) / REPEATS
+        start = time.time()
+        fast = [repeats.repeated_sequences([n.exact_degree for n in m.notes]) for m in melodies]
+        fast_time = 1000.0 * (time.time() - start) / REPEATS
+        if measures <= NAIVE_MAX_MEASURES:
+            start = time.time()
+            naive = [naive_repeated_sequences(m) for m in melodies]
+            naive_time = "%.2f" % (1000.0 * (time.time() - start) / REPEATS)
+            if naive != fast:
+                raise NameError("Suffix array count does not match the naive count.")
+        else:
+            naive_time = "-"
+        print("%d\t%d\t%s\t%.2f" % (measures, notes, naive_time, fast_time))
+
+# bytes held by a melody's tick data, as arrays and with the note object views built
+def melody_memory():
+    MEASURES = [4, 16, 64]
+
+    seed(0)
+    print("measures\tarrays (bytes)\tviews (bytes)")
+    for measures in MEASURES:
+        m = melody.create_random_melody(measures=measures)
+        arrays = deep_size([m.kinds, m.pitches, m.durations])
+        views = deep_size([m.instants, m.notes, m.notes_and_rests])
+        print("%d\t%d\t%d" % (measures, arrays, views))
+
+# size of an object and everything it refers to, each object counted once
+def deep_size(obj):
+    return sum(sys.getsizeof(o) for o in deep_objects(obj))
+
+# an object and everything it refers to, each object once
+def deep_objects(obj, seen=None):
+    if seen is None:
+        seen = {}
+    if seen.has_key(id(obj)):
+        return []
+    seen[id(obj)] = obj
+    ret = [obj]
+    if isinstance(obj, (list, tuple)):
+        for item in obj:
+            ret += deep_objects(item, seen)
+    elif isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            ret += deep_objects(key, seen) + deep_objects(value, seen)
+    elif hasattr(obj, '__dict__'):
+        ret += deep_objects(obj.__dict__, seen)
+    elif hasattr(obj, '__slots__'):
+        for key in obj.__slots__:
+            ret += deep_objects(getattr(obj, key, None), seen)
+    return ret
+
+# the original Note, it rebuilt its strings in on_change every time it was made or transposed
+class OriginalNote(note.Note):
+    def __init__(self, *args, **kwargs):
+        if len(args) != 0:
+            raise NameError("Invalid use of NoteIK")
+        if kwargs.has_key('string'):
+            self.degree = int(kwargs['string'][0])
+            self.octave = int(kwargs['string'][2])
+            self.duration = len(kwargs['string']) - 2
+        elif kwargs.has_key('exact_degree'):
+            self.degree = (kwargs['exact_degree'] - 1) % 7 + 1
+            self.octave = (kwargs['exact_degree'] - 1) / 7 + 1
+            self.duration = kwargs.get('duration', 1)
+        elif kwargs.has_key('degree') and kwargs.has_key('octave'):
+            self.degree = kwargs['degree']
+            self.octave = kwargs['octave']
+            self.duration = kwargs.get('duration', 1)
+        else:
+            raise NameError("Invalid use of Note()")
+        self.location = None
+        self.on_change()
+    def on_change(self):
+        if self.degree < 1 or self.degree > 7 or self.octave < 1 or self.octave > 7:
+            raise NameError("Invalid degree or octave: %d,%d" % (self.degree, self.octave))
+        self.exact_degree = self.degree + 7 * (self.octave - 1)
+        self.degree_octave_str = str(self.degree) + ',' + str(self.octave)
+        self.name = note.name_from_degree(self.degree)
+        self.name_with_octave = self.name + str(self.octave)
+    def transpose(self, degrees, in_place=True):
+        if in_place:
+            self.degree += degrees
+            while self.degree < 1:
+                self.degree += 7
+                self.octave -= 1
+            while self.degree > 7:
+                self.degree -= 7
+                self.octave += 1
+            self.on_change()
+        else:
+            ret = OriginalNote(degree=self.degree, octave=self.octave)
+            ret.transpose(degrees)
+            return ret
+
+# the original create_random_melody, it made and transposed a note for every pitch it tried (the same random draws as
+# melody.create_random_melody, so it makes the same melodies)
+def original_create_random_melody(measures=4, chord_progression=progression.Progression(['I', 'V', 'vi', 'IV'])):
+    MAX_RANGE = 13 # in degrees
+    UPPER_NOTE_BOUND = OriginalNote(string='5,5')
+    LOWER_NOTE_BOUND = OriginalNote(string='5,3')
+    POSSIBLE_START_NOTES = ['1,4', '2,4', '3,4', '4,4', '5,4', '6,4', '7,4', '1,5']
+    CHANCE_OF_REST = 0.1
+    CHANCE_OF_EXTENSION = 0.5
+    MINOR_CHANCE = 0.5
+    #                      -7    -6    -5    -4    -3    -2     -1    0    +1    +2    +3    +4    +5    +6    +7
+    CHANCE_OF_MOVEMENT = [0.05, 0.05, 0.05, 0.05, 0.05, 0.10, 0.10, 0.10, 0.10, 0.10, 0.05, 0.05, 0.05, 0.05, 0.05]
+
+    ret = melody.Melody()
+    if random() < MINOR_CHANCE:
+        ret.minor = True
+    length = 8 * measures
+    ret.chord_progression = chord_progression
+
+    start_note = OriginalNote(string=POSSIBLE_START_NOTES[randint(0, len(POSSIBLE_START_NOTES) - 1)])
+    while random() < CHANCE_OF_EXTENSION:
+        start_note.duration += 1
+    ret.append(start_note)
+    last_note = start_note
+    lowest_note = start_note
+    highest_note = start_note
+    while True:
+        rand = random()
+        if rand < CHANCE_OF_REST:
+            cur = note.Rest()
+        else:
+            upper_bound = min(UPPER_NOTE_BOUND, lowest_note.transpose(MAX_RANGE, in_place=False))
+            lower_bound = max(LOWER_NOTE_BOUND, highest_note.transpose(MAX_RANGE * -1, in_place=False))
+            while True:
+                cur = OriginalNote(exact_degree=last_note.exact_degree)
+                rand = random()
+                i = 0
+                while rand > CHANCE_OF_MOVEMENT[i]:
+                    rand -= CHANCE_OF_MOVEMENT[i]
+                    i += 1
+                cur.transpose(i - 7)
+                if cur < upper_bound and cur > lower_bound:
+                    break
+            if cur < lowest_note:
+                lowest_note = cur
+            if cur > highest_note:
+                highest_note = cur
+            last_note = cur
+        while random() < CHANCE_OF_EXTENSION:
+            cur.duration += 1
+        if ret.duration() + cur.duration >= length:
+            cur.duration = length - ret.duration()
+            ret.append(cur)
+            break
+        ret.append(cur)
+
+    return ret
+
+# the original mutate only differed in making its three bounds as notes
+def original_mutate(m):
+    OriginalNote(string='5,5')
+    OriginalNote(string='5,3')
+    OriginalNote(string='1,4')
+    return m.mutate()
+
+# generates a melody and mutates it, with the original note code if original
+def generate(measures, original):
+    if original:
+        return original_mutate(original_create_random_melody(measures=measures))
+    return melody.create_random_melody(measures=measures).mutate()
+
+# note objects made while running f, and the strings made for them (the ones they were given that aren't shared
+# with note.PITCHES)
+def count_note_allocations(f):
+    shared = set(id(s) for p in note.PITCHES[1:] for s in [p.degree_octave_str, p.name, p.name_with_octave])
+    notes = {} # id -> object, holding on to them so their ids aren't reused
+    strings = {}
+    def profile(frame, event, arg):
+        if event != 'return' or frame.f_code.co_name not in ['__init__', 'on_change', 'set_pitch']:
+            return
+        obj = frame.f_locals.get('self')
+        if isinstance(obj, (note.Note, note.Rest)):
+            notes[id(obj)] = obj
+            for value in obj.__dict__.itervalues():
+                if isinstance(value, str) and id(value) not in shared:
+                    strings[id(value)] = value
+    sys.setprofile(profile)
+    try:
+        f()
+    finally:
+        sys.setprofile(None)
+    return len(notes), len(strings)
+
+# notes and strings made, and time taken, to generate a melody and mutate it, with the original note code (which
+# rebuilt every note's strings in on_change) and with the shared pitch table
+def note_allocations():
+    MEASURES = [4, 16, 64]
+    REPEATS = 200
+
+    print("code\tmeasures\tnotes\tstrings\tgenerate + mutate (ms)")
+    for measures in MEASURES:
+        for original in [True, False]:
+            seed(0)
+            notes, strings = count_note_allocations(lambda: [generate(measures, original) for i in range(REPEATS)])
+            seed(0)
+            start = time.time()
+            for i in range(REPEATS):
+                generate(measures, original)
+            elapsed = 1000.0 * (time.time() - start) / REPEATS
+            if original:
+                name = 'original'
+            else:
+                name = 'current'
+            print("%s\t%d\t%d\t%d\t%.3f" % (name, measures, notes / REPEATS, strings / REPEATS, elapsed))
+
+# melodies scored and time taken to reach a target, by the hill climber and by the population engine
+def genetic():
+    TARGET = melody.Target(en=[10, 20], kd=[0, 10], rt=[40, 60], tt=[20, 40], re=[15, 30], si=[0, 15])
+    SEEDS = range(10)
+    MAX_EVALUATIONS = 20000
+    OFFSPRING = 50
+    POPULATION_SIZE = 30
+
+    print("seed\tclimber (evaluations)\tclimber (s)\tpopulation (evaluations)\tpopulation (s)")
+    for s in SEEDS:
+        seed(s)
+        ancestor = melody.create_random_melody()
+        ancestor.calculate_characteristics()
+
+        start = time.time()
+        parent = ancestor
+        climber = 1
+        while parent.distance_to_target(TARGET) > 0.0 and climber < MAX_EVALUATIONS:
+            parent = melody.genetic_algorithm(TARGET, parent, 1, OFFSPRING)
+            climber += OFFSPRING
+        climber_time = time.time() - start
+
+        start = time.time()
+        for best, population in melody.population_generations(TARGET, ancestor, POPULATION_SIZE):
+            if best.distance_to_target(TARGET) == 0.0 or population >= MAX_EVALUATIONS:
+                break
+        population_time = time.time() - start
+
+        print("%d\t%d\t%.2f\t%d\t%.2f" % (s, climber, climber_time, population, population_time))
+
+# time to write melodies as midi files through music21 streams and with midi.py (one process and all the cores)
+def midi_export():
+    MUSIC21_MELODIES = 20
+    MELODIES = 2000
+    WORKERS = multiprocessing.cpu_count()
+
+    seed(0)
+    melodies = melody.create_random_melodies(MELODIES)
+    folder = tempfile.mkdtemp()
+    start = time.time()
+    for i in range(MUSIC21_MELODIES):
+        melodies[i].get_music21().write('midi', os.path.join(folder, '%d.mid' % i))
+    music21_time = 1000.0 * (time.time() - start) / MUSIC21_MELODIES
+    start = time.time()
+    midi.write_melodies(melodies, folder)
+    direct_time = 1000.0 * (time.time() - start) / MELODIES
+    start = time.time()
+    midi.write_melodies(melodies, folder, WORKERS)
+    parallel_time = 1000.0 * (time.time() - start) / MELODIES
+    pool.close()
+    shutil.rmtree(folder)
+    print("music21 (ms per melody)\tmidi.py (ms per melody)\tmidi.py, %d workers (ms per melody)" % WORKERS)
+    print("%.2f\t%.3f\t%.3f" % (music21_time, direct_time, parallel_time))
+
+# time for a new python process to import melody, and whether that loaded music21
+def startup():
+    REPEATS = 10
+    IMPORT = ("import time\nstart = time.time()\nimport melody\nimport sys\n"
+              "print('%f %d' % (time.time() - start, 'music21' in sys.modules))")
+
+    times = []
+    for i in range(REPEATS):
+        elapsed, music21 = subprocess.check_output([sys.executable, '-c', IMPORT], cwd=sys.path[0]).split()
+        times.append(1000.0 * float(elapsed))
+    print("import melody, best (ms)\timport melody, average (ms)\tmusic21 loaded")
+    print("%.1f\t%.1f\t%s" % (min(times), sum(times) / len(times), bool(int(music21))))
+
+# BENCHMARK SUITE
+# seeded timings of the hot paths (micro benchmarks) and of whole runs (macro benchmarks), saved as json and compared
+# against an earlier run's json
+# every benchmark is timed REPEATS times from the same seed and the fastest time is kept (slower ones are the rest of
+# the machine getting in the way), a micro benchmark calls its function enough times to take at least MIN_TIME
+# seconds each time
+# a benchmark more than TOLERANCE slower than in the baseline is a regression, the exit code is 1 if there are any
+SUITE_REPEATS = 5
+SUITE_MIN_TIME = 0.1
+SUITE_TOLERANCE = 0.25
+
+def suite(results_file=None, baseline_file=None):
+    results = {}
+    print("benchmark\ttime (ms)")
+    for name, f, macro in suite_benchmarks():
+        results[name] = best_time(f, macro)
+        print("%s\t%.4f" % (name, 1000.0 * results[name]))
+    if results_file is not None:
+        f = open(results_file, 'w')
+        json.dump({'python': sys.version.split()[0], 'repeats': SUITE_REPEATS, 'seconds': results}, f, indent=2,
+                  sort_keys=True)
+        f.close()
+    if baseline_file is not None:
+        f = open(baseline_file, 'r')
+        baseline = json.load(f)['seconds']
+        f.close()
+        print("")
+        if len(compare(results, baseline, SUITE_TOLERANCE)) != 0:
+            sys.exit(1)
+
+# (name, function, whether it's a macro benchmark), in the order they run
+def suite_benchmarks():
+    TARGET = melody.Target(en=[10, 20], kd=[0, 10], rt=[40, 60], tt=[20, 40], re=[15, 30], si=[0, 15])
+    CHARACTERISTICS = ['get_energetic', 'get_progression_dissonant', 'get_key_dissonant', 'get_rhythmic',
+                       'get_rhythmically_thematic', 'get_tonally_thematic', 'get_repetitive', 'get_dense',
+                       'get_silent']
+    GENETIC_SIZES = [(10, 10), (50, 20), (100, 50)] # generations, offspring
+    VIABLE_CHORDS = ['I', 'ii', 'iii', 'III', 'IV', 'V', 'vi']
+    DATA_FILE = os.path.join(sys.path[0], "progression_data.txt")
+
+    seed(0)
+    m = melody.create_random_melody()
+    m.calculate_characteristics()
+    string = str(m)
+    tree = progression.build_decision_tree(2, 6, 1, VIABLE_CHORDS)
+    progression.teach_decision_tree(DATA_FILE, tree)
+
+    ret = []
+    ret.append(('melody.parse', lambda: melody.Melody().parse(string), False))
+    ret.append(('melody.str', lambda: str(m), False))
+    ret.append(('melody.mutate', lambda: m.mutate(), False))
+    for name in CHARACTERISTICS:
+        ret.append(('melody.' + name, getattr(m, name), False))
+    ret.append(('melody.distance_to_target', lambda: m.distance_to_target(TARGET), False))
+    ret.append(('create_random_melody', lambda: melody.create_random_melody(), False))
+    ret.append(('progression.build_decision_tree', lambda: progression.build_decision_tree(2, 6, 1, VIABLE_CHORDS),
+                False))
+    ret.append(('progression.teach_decision_tree',
+                lambda: progression.teach_decision_tree(DATA_FILE, progression.build_decision_tree(2, 6, 1,
+                                                                                                   VIABLE_CHORDS)),
+                False))
+    ret.append(('progression.create_progression', lambda: progression.create_progression(tree, 0.0), False))
+    for generations, offspring in GENETIC_SIZES:
+        ret.append(('genetic_algorithm.%dx%d' % (generations, offspring),
+                    lambda g=generations, o=offspring: melody.genetic_algorithm(TARGET, None, g, o, master_seed=0),
+                    True))
+    ret.append(('load_sample_songs', lambda: batch.calculate_characteristics(i_o.melodies_from_sample_folder()), True))
+    return ret
+
+# fastest of SUITE_REPEATS timings of f in seconds per call
+def best_time(f, macro):
+    number = 1
+    if not macro:
+        seed(0)
+        start = time.time()
+        f()
+        number = max(1, int(SUITE_MIN_TIME / max(time.time() - start, 1e-6)))
+    ret = None
+    for i in range(SUITE_REPEATS):
+        seed(0)
+        start = time.time()
+        for j in range(number):
+            f()
+        elapsed = (time.time() - start) / number
+        if ret is None or elapsed < ret:
+            ret = elapsed
+    return ret
+
+# prints every benchmark next to its baseline time and returns the names of the regressions
+def compare(results, baseline, tolerance):
+    ret = []
+    print("benchmark\tbaseline (ms)\tnow (ms)\tchange")
+    for name in sorted(results.keys()):
+        if not baseline.has_key(name):
+            print("%s\t-\t%.4f\tnew" % (name, 1000.0 * results[name]))
+            continue
+        change = results[name] / baseline[name] - 1.0
+        if change > tolerance:
+            flag = "\tREGRESSION"
+            ret.append(name)
+        else:
+            flag = ""
+        print("%s\t%.4f\t%.4f\t%+.1f%%%s" % (name, 1000.0 * baseline[name], 1000.0 * results[name], 100.0 * change,
+                                           flag))
+    print("%d regressions (more than %d%% slower)" % (len(ret), int(100 * tolerance)))
+    return ret
+
+BENCHMARKS = {}
+BENCHMARKS['tonally_thematic'] = tonally_thematic
+BENCHMARKS['melody_memory'] = melody_memory
+BENCHMARKS['genetic'] = genetic
+BENCHMARKS['note_allocations'] = note_allocations
+BENCHMARKS['midi_export'] = midi_export
+BENCHMARKS['startup'] = startup
+BENCHMARKS['suite'] = suite
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or not BENCHMARKS.has_key(sys.argv[1]) or (sys.argv[1] != 'suite' and len(sys.argv) != 2):
+        print("usage: python benchmark.py <%s>" % '|'.join(sorted(BENCHMARKS.keys())))
+        print("       python benchmark.py suite [results file] [baseline file]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
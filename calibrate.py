@@ -0,0 +1,70 @@
+# calibrate.py
+
+# scores lots of random melodies on several processes to calibrate the normalizing constants of Melody (EN_A, EN_B,
+# ... SI_B)
+# n is split into shards, each shard is generated and scored in a worker with its own seed (drawn from the master
+# seed) and only its analysis.CharacteristicStats come back, which are merged
+# the suggested constants put the mean of every characteristic of a random melody at TARGET_MEAN and its standard
+# deviation at TARGET_STD_DEV
+
+import os
+import random
+import time
+import analysis
+import melody
+import pool
+
+TARGET_MEAN = 20.0
+TARGET_STD_DEV = 4.0
+SHARDS_PER_WORKER = 4 # more shards than workers so that a slow worker doesn't hold up the rest
+
+def run(n, workers=1, seed=None, measures=4):
+    stats, throughputs = calibrate(n, workers, seed, measures)
+    for pid, (count, seconds) in sorted(throughputs.iteritems()):
+        print("worker %d: %d melodies in %.1fs, %.0f melodies/sec" % (pid, count, seconds, count / max(seconds, 1e-9)))
+    for key, (a, b) in sorted(suggested_constants(stats).iteritems()):
+        s = stats[key]
+        print("%s avg: %f std_dev: %f -> %s_A = %.2f, %s_B = %.2f" % (key, s.mean, s.std_dev(), key.upper(), a,
+                                                                       key.upper(), b))
+
+# returns (characteristic -> analysis.CharacteristicStats, process id -> (melodies scored, seconds spent))
+def calibrate(n, workers=1, seed=None, measures=4):
+    rng = random.Random(seed)
+    shards = max(1, min(n, workers * SHARDS_PER_WORKER))
+    tasks = []
+    for i in range(shards):
+        tasks.append((n // shards + (1 if i < n % shards else 0), rng.randint(0, pool.MAX_SEED), measures))
+    if workers > 1:
+        results = pool.get(workers).map(_shard, tasks)
+    else:
+        results = [_shard(task) for task in tasks]
+    stats = {}
+    throughputs = {}
+    for shard_stats, pid, count, seconds in results:
+        stats = analysis.merge_characteristic_stats(stats, shard_stats)
+        total_count, total_seconds = throughputs.get(pid, (0, 0.0))
+        throughputs[pid] = (total_count + count, total_seconds + seconds)
+    return stats, throughputs
+
+# characteristic -> (A, B) that would give the values in stats a mean of TARGET_MEAN and a standard deviation of
+# TARGET_STD_DEV (stats were taken with the current constants, value = A * raw + B)
+def suggested_constants(stats, cls=melody.Melody):
+    ret = {}
+    for key, s in stats.iteritems():
+        a = getattr(cls, key.upper() + '_A')
+        b = getattr(cls, key.upper() + '_B')
+        if s.std_dev() == 0.0 or a == 0.0:
+            continue
+        raw_mean = (s.mean - b) / a
+        raw_std_dev = s.std_dev() / abs(a)
+        new_a = TARGET_STD_DEV / raw_std_dev
+        ret[key] = (new_a, TARGET_MEAN - new_a * raw_mean)
+    return ret
+
+# runs in the workers
+def _shard(task):
+    n, seed, measures = task
+    start = time.time()
+    random.seed(seed)
+    stats = analysis.characteristic_stats(melody.generate_random_melodies(n, measures=measures))
+    return stats, os.getpid(), n, time.time() - start
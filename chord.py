@@ -2,23 +2,34 @@
 # Calvin Pelletier
 # 1/20/16
 
+import numpy
 import note
-import music21
+import notation
+
+# dissonance of each degree (1 to 7) of the key against a chord
+DISSONANCE = {}
+DISSONANCE['I']   = [0.0, 1.0, 0.1, 1.0, 0.0, 1.0, 0.6]
+DISSONANCE['ii']  = [0.6, 0.0, 1.0, 0.1, 1.0, 0.0, 1.0]
+DISSONANCE['iii'] = [1.0, 1.0, 0.0, 1.0, 0.1, 1.0, 0.0]
+DISSONANCE['III'] = [1.0, 1.0, 0.0, 1.0, 9.9, 1.0, 0.0]
+DISSONANCE['IV']  = [0.0, 1.0, 0.6, 0.0, 1.0, 0.1, 1.0]
+DISSONANCE['V']   = [1.0, 0.0, 1.0, 0.4, 0.0, 1.0, 0.1]
+DISSONANCE['vi']  = [0.1, 1.0, 0.0, 1.0, 1.0, 0.0, 1.0]
+
+# the same as a matrix, row = index of the chord in NUMERALS, column = degree - 1
+NUMERALS = ['I', 'ii', 'iii', 'III', 'IV', 'V', 'vi']
+NUMERAL_INDEX = dict((numeral, i) for i, numeral in enumerate(NUMERALS))
+DISSONANCE_MATRIX = numpy.array([DISSONANCE[numeral] for numeral in NUMERALS])
 
 class Chord:
     def __init__(self, numeral):
         self.numeral = numeral
     def dissonance_of_note(self, n):
-        DISSONANCE = {}
-        DISSONANCE['I']   = [0.0, 1.0, 0.1, 1.0, 0.0, 1.0, 0.6]
-        DISSONANCE['ii']  = [0.6, 0.0, 1.0, 0.1, 1.0, 0.0, 1.0]
-        DISSONANCE['iii'] = [1.0, 1.0, 0.0, 1.0, 0.1, 1.0, 0.0]
-        DISSONANCE['III'] = [1.0, 1.0, 0.0, 1.0, 9.9, 1.0, 0.0]
-        DISSONANCE['IV']  = [0.0, 1.0, 0.6, 0.0, 1.0, 0.1, 1.0]
-        DISSONANCE['V']   = [1.0, 0.0, 1.0, 0.4, 0.0, 1.0, 0.1]
-        DISSONANCE['vi']  = [0.1, 1.0, 0.0, 1.0, 1.0, 0.0, 1.0]
-        return DISSONANCE[self.numeral][n.degree - 1]
+        return self.dissonance_of_degree(n.degree)
+    def dissonance_of_degree(self, degree):
+        return DISSONANCE[self.numeral][degree - 1]
     def get_music21(self):
+        music21 = notation.music21()
         k = music21.key.Key('C')
         ret = music21.roman.RomanNumeral(self.numeral, k)
         if self.numeral == 'I':
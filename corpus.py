@@ -0,0 +1,183 @@
+# corpus.py
+
+# many melodies in one binary file, instead of one text file each
+# file layout (little endian):
+#   header: HEADER (magic, version, number of melodies, offset of the index)
+#   records, one per melody: RECORD (ticks, length of the chord progression, minor, rhythmic style), the chord
+#                            progression ('I-V-vi-IV'), then the kinds (1 byte per tick), pitches (1 byte per tick) and
+#                            durations (2 bytes per tick) arrays exactly as Melody stores them
+#   index, one entry per melody in the order they were added: length of the ID (2 bytes), the ID, offset of the record
+#                                                             (8 bytes)
+# the file is memory mapped, a melody is read by copying its three arrays straight out of the map (no parsing), views()
+# gives numpy arrays over the file itself instead, without copying anything
+# appending writes the new records and a new index after the end of the file, and only once they're on disk points
+# the header at the new index, so a crash or a full disk partway through leaves the corpus as it was
+# a melody appended with an ID that's already in the corpus replaces it (the old record, like every old index, is left
+# unused)
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+import numpy
+import melody
+import progression
+import i_o
+
+MAGIC = 'MCR1'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQ')
+RECORD = struct.Struct('<IHBB')
+INDEX_ID = struct.Struct('<H')
+INDEX_OFFSET = struct.Struct('<Q')
+
+class Corpus:
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            f = open(path, 'wb')
+            f.write(HEADER.pack(MAGIC, VERSION, 0, HEADER.size))
+            f.close()
+        self.file = open(path, 'r+b')
+        self.progressions = {} # string -> progression.Progression, shared by the melodies read
+        self.open_map()
+
+    def open_map(self):
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, self.index_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise NameError("Not a melody corpus file: %s" % self.path)
+        self.ids = [] # in the order they were added
+        self.offsets = {} # ID -> offset of its record
+        offset = self.index_offset
+        for i in range(count):
+            length = INDEX_ID.unpack_from(self.map, offset)[0]
+            offset += INDEX_ID.size
+            ID = self.map[offset:offset + length]
+            offset += length
+            self.ids.append(ID)
+            self.offsets[ID] = INDEX_OFFSET.unpack_from(self.map, offset)[0]
+            offset += INDEX_OFFSET.size
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, ID):
+        return self.offsets.has_key(ID)
+
+    def get(self, ID):
+        if not self.offsets.has_key(ID):
+            raise NameError("No melody with ID %s in %s." % (ID, self.path))
+        return self.read(ID, self.offsets[ID])
+
+    # every melody, in the order they were added
+    def melodies(self):
+        return [self.read(ID, self.offsets[ID]) for ID in self.ids]
+
+    def read(self, ID, offset):
+        ticks, progression_length, minor, rhythmic_style = RECORD.unpack_from(self.map, offset)
+        offset += RECORD.size
+        chords = self.map[offset:offset + progression_length]
+        offset += progression_length
+        if not self.progressions.has_key(chords):
+            self.progressions[chords] = progression.Progression(chords.split('-'))
+        ret = melody.Melody(chord_progression=self.progressions[chords], minor=bool(minor),
+                            rhythmic_style=rhythmic_style)
+        ret.ID = ID
+        ret.kinds.fromstring(self.map[offset:offset + ticks])
+        offset += ticks
+        ret.pitches.fromstring(self.map[offset:offset + ticks])
+        offset += ticks
+        ret.durations.fromstring(self.map[offset:offset + 2 * ticks])
+        if sys.byteorder == 'big':
+            ret.durations.byteswap()
+        return ret
+
+    # every melody's record as a RecordView, in the order they were added
+    # the arrays are read only views over a memory map of the file, nothing is copied until they're used, and they
+    # stay valid after the corpus is extended or closed (records are never overwritten)
+    def views(self):
+        data = numpy.memmap(self.path, dtype=numpy.uint8, mode='r')
+        ret = []
+        for ID in self.ids:
+            offset = self.offsets[ID]
+            ticks, progression_length, minor, rhythmic_style = RECORD.unpack_from(self.map, offset)
+            offset += RECORD.size
+            chords = self.map[offset:offset + progression_length]
+            offset += progression_length
+            kinds = data[offset:offset + ticks].view(numpy.int8)
+            offset += ticks
+            pitches = data[offset:offset + ticks].view(numpy.int8)
+            offset += ticks
+            durations = data[offset:offset + 2 * ticks].view('<u2')
+            ret.append(RecordView(ID, chords, bool(minor), rhythmic_style, kinds, pitches, durations))
+        return ret
+
+    def append(self, m):
+        self.extend([m])
+
+    # if writing fails the corpus is left (and reopened) as it was before
+    def extend(self, melodies):
+        ids = list(self.ids)
+        offsets = dict(self.offsets)
+        self.map.close()
+        try:
+            self.file.seek(0, os.SEEK_END)
+            for m in melodies:
+                if not offsets.has_key(m.ID):
+                    ids.append(m.ID)
+                offsets[m.ID] = self.file.tell()
+                self.file.write(record(m))
+            index_offset = self.file.tell()
+            for ID in ids:
+                self.file.write(INDEX_ID.pack(len(ID)) + ID + INDEX_OFFSET.pack(offsets[ID]))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.seek(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, len(ids), index_offset))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        finally:
+            self.open_map()
+
+# a melody's record without making a Melody, see Corpus.views
+# chord_progression is the string the progression is stored as ('I-V-vi-IV'), kinds, pitches (int8) and durations
+# (uint16) are numpy arrays holding what the Melody arrays of the same name would
+class RecordView:
+    def __init__(self, ID, chord_progression, minor, rhythmic_style, kinds, pitches, durations):
+        self.ID = ID
+        self.chord_progression = chord_progression
+        self.minor = minor
+        self.rhythmic_style = rhythmic_style
+        self.kinds = kinds
+        self.pitches = pitches
+        self.durations = durations
+
+def record(m):
+    chords = str(m.chord_progression)
+    durations = array('H', m.durations)
+    if sys.byteorder == 'big':
+        durations.byteswap()
+    return (RECORD.pack(m.duration(), len(chords), int(m.minor), m.rhythmic_style) + chords + m.kinds.tostring() +
+            m.pitches.tostring() + durations.tostring())
+
+# CONVERTERS
+# every text file (the format i_o.save_melody writes) in folder into the corpus at path, IDs are the file names
+# (hidden files, like the sidecar.py cache, are skipped)
+def from_txt_folder(folder, path):
+    ret = Corpus(path)
+    filenames = sorted(i_o.song_files(folder))
+    ret.extend([i_o.melody_from_txt_file(os.path.join(folder, filename)) for filename in filenames])
+    return ret
+
+# every melody in the corpus at path into a text file in folder named after its ID
+def to_txt_folder(path, folder):
+    c = Corpus(path)
+    for m in c.melodies():
+        i_o.melody_to_txt_file(m, os.path.join(folder, m.ID))
+    c.close()
@@ -0,0 +1,77 @@
+# fitness.py
+
+# least recently used cache of melody characteristics
+# mutate() often returns a child identical to its parent or to one of its siblings, the cache lets those skip
+# scoring entirely
+# a melody's key is its kinds and pitches arrays as bytes (the arrays are always in the form parse() produces, so
+# equal melodies have equal bytes) plus the chord progression, minor and rhythmic style it's scored against
+
+from collections import OrderedDict
+import batch
+
+class FitnessCache:
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # fills in the characteristics in keys (all of them if it's None) of every melody, scoring (together, see
+    # batch.py) only the ones not in the cache
+    # entries can be partial, they only count as hits if they have every characteristic in keys
+    # a melody only counts as a hit or a miss the first time it's looked up, while none of its characteristics are
+    # filled in (CompiledTarget.score asks for them in stages)
+    def calculate_characteristics(self, melodies, keys=None):
+        if keys is None:
+            keys = batch.KEYS
+        misses = []
+        pending = {} # key -> the melody that'll be scored for it, for duplicates within melodies
+        duplicates = []
+        for m in melodies:
+            k = key(m)
+            entry = self.entries.get(k)
+            counted = all(value is None for value in m.characteristics.itervalues())
+            if entry is not None and all(entry.has_key(name) for name in keys):
+                del self.entries[k]
+                self.entries[k] = entry
+                m.characteristics.update(entry)
+                if counted:
+                    self.hits += 1
+            elif pending.has_key(k):
+                duplicates.append((m, pending[k]))
+                if counted:
+                    self.hits += 1
+            else:
+                pending[k] = m
+                misses.append(m)
+                if counted:
+                    self.misses += 1
+        batch.calculate_characteristics(misses, keys)
+        for m in misses:
+            self.put(m)
+        for m, original in duplicates:
+            for name in keys:
+                m.characteristics[name] = original.characteristics[name]
+
+    # adds the calculated (not None) characteristics of m to its entry
+    def put(self, m):
+        k = key(m)
+        entry = self.entries.pop(k, {})
+        for name, value in m.characteristics.iteritems():
+            if value is not None:
+                entry[name] = value
+        self.entries[k] = entry
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / float(self.hits + self.misses)
+
+    def __str__(self):
+        return "%d hits, %d misses (%.1f%% hit rate), %d cached" % (self.hits, self.misses, 100.0 * self.hit_rate(),
+                                                                    len(self.entries))
+
+def key(m):
+    return (m.kinds.tostring(), m.pitches.tostring(), str(m.chord_progression), m.minor, m.rhythmic_style)
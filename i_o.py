@@ -4,7 +4,6 @@
 
 import melody
 import progression
-import music21
 import os
 import sys
 
@@ -23,18 +22,25 @@ def melody_from_txt_file(filepath):
 
 def melodies_from_generated_folder():
     ret = []
-    for filename in os.listdir(os.path.join(sys.path[0], "generated-songs")):
+    for filename in song_files(os.path.join(sys.path[0], "generated-songs")):
         ret.append(melody_from_txt_file(os.path.join(sys.path[0], "generated-songs", filename)))
     return ret
 
 def melodies_from_sample_folder():
     ret = []
-    for filename in os.listdir(os.path.join(sys.path[0], "sample-songs")):
+    for filename in song_files(os.path.join(sys.path[0], "sample-songs")):
         ret.append(melody_from_txt_file(os.path.join(sys.path[0], "sample-songs", filename)))
     return ret
 
+# names of the melody files in a folder, hidden files (like the sidecar.py cache) are skipped
+def song_files(folder):
+    return [filename for filename in os.listdir(folder) if not filename.startswith('.')]
+
 def save_melody(m, name):
-    f = open(os.path.join(sys.path[0], "generated-songs", name), 'w')
+    melody_to_txt_file(m, os.path.join(sys.path[0], "generated-songs", name))
+
+def melody_to_txt_file(m, filepath):
+    f = open(filepath, 'w')
     if m.minor:
         f.write("minor\n")
     else:
@@ -0,0 +1,140 @@
+# jobs.py
+
+# runs many genetic algorithm jobs from a job file without any prompts, several at a time on the process pool
+# usage: python jobs.py <job file> [workers] [corpus file]
+# the result of each job is saved to generated-songs with i_o.save_melody under the job's name, or into the corpus
+# file (see corpus.py) with the job's name as its ID if one is given, then a summary of the jobs is printed
+#
+# job file: one job per line, fields separated by spaces, blank lines and lines starting with # are skipped
+#   name=calm generations=200 offspring=50 seed=7 en=10-20 tt=20-40 si=0-15
+#   name (required): name of the result
+#   generations, offspring (required), seed, patience: passed to melody.genetic_algorithm, a job with a seed gives the
+#                                                      same melody every time
+#   en, pd, kd, rh, rt, tt, re, de, si: target range of the characteristic, characteristics that aren't listed are
+#                                       left out of the target (like 'x' in minerva)
+
+import os
+import sys
+import time
+import melody
+import i_o
+import corpus
+import pool
+
+class Job:
+    def __init__(self, name, target, generations, offspring, seed=None, patience=None):
+        self.name = name
+        self.target = target
+        self.generations = generations
+        self.offspring = offspring
+        self.seed = seed
+        self.patience = patience
+
+# finished job: its best melody, that melody's distance to the target and the seconds the job took
+class Result:
+    def __init__(self, job, m, distance, seconds):
+        self.job = job
+        self.melody = m
+        self.distance = distance
+        self.seconds = seconds
+
+def read_jobs(path):
+    ret = []
+    f = open(path, 'r')
+    for i, line in enumerate(f):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        try:
+            ret.append(parse_job(line))
+        except (NameError, ValueError) as e:
+            raise NameError("Invalid job on line %d of %s: %s" % (i + 1, path, e))
+    f.close()
+    names = [job.name for job in ret]
+    if len(set(names)) != len(names):
+        raise NameError("Two jobs in %s have the same name." % path)
+    return ret
+
+def parse_job(line):
+    REQUIRED = ['name', 'generations', 'offspring']
+    INTEGERS = ['generations', 'offspring', 'seed', 'patience']
+
+    fields = {}
+    for field in line.split():
+        if '=' not in field:
+            raise NameError("Expected key=value, got '%s'." % field)
+        key, value = field.split('=', 1)
+        fields[key] = value
+    for key in REQUIRED:
+        if not fields.has_key(key):
+            raise NameError("Missing %s." % key)
+    target = melody.Target()
+    for key, value in fields.iteritems():
+        if target.characteristics.has_key(key):
+            bounds = [float(x) for x in value.split('-')]
+            if len(bounds) != 2 or bounds[0] > bounds[1]:
+                raise NameError("Invalid range for %s: '%s'." % (key, value))
+            target.characteristics[key] = bounds
+        elif key in INTEGERS:
+            fields[key] = int(value)
+        elif key != 'name':
+            raise NameError("Unknown field '%s'." % key)
+    return Job(fields['name'], target, fields['generations'], fields['offspring'], fields.get('seed'),
+               fields.get('patience'))
+
+# runs the jobs workers at a time, every job on one core, and returns their results in the order of the jobs
+def run_jobs(jobs, workers=1):
+    if workers == 1:
+        return [run_job(job) for job in jobs]
+    return pool.get(workers).map(run_job, jobs, 1)
+
+def run_job(job):
+    start = time.time()
+    m = melody.genetic_algorithm(job.target, None, job.generations, job.offspring, master_seed=job.seed,
+                                 patience=job.patience)
+    m.ID = job.name
+    return Result(job, m, job.target.compile().distance(m), time.time() - start)
+
+def save_results(results, corpus_path=None):
+    if corpus_path is None:
+        folder = os.path.join(sys.path[0], "generated-songs")
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        for r in results:
+            i_o.save_melody(r.melody, r.job.name)
+    else:
+        c = corpus.Corpus(corpus_path)
+        c.extend([r.melody for r in results])
+        c.close()
+
+def print_summary(results, wall_time):
+    print("job\tdistance\ttime (s)")
+    for r in results:
+        print("%s\t%f\t%.2f" % (r.job.name, r.distance, r.seconds))
+    if len(results) == 0:
+        return
+    reached = len([r for r in results if r.distance == 0.0])
+    job_time = sum(r.seconds for r in results)
+    print("%d jobs, %d reached their target, mean distance %f, worst distance %f" %
+          (len(results), reached, sum(r.distance for r in results) / len(results), max(r.distance for r in results)))
+    print("job time %.2fs, wall time %.2fs (%.1fx)" % (job_time, wall_time, job_time / max(wall_time, 1e-9)))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or len(sys.argv) > 4:
+        print("usage: python jobs.py <job file> [workers] [corpus file]")
+        sys.exit(1)
+    jobs = read_jobs(sys.argv[1])
+    if len(sys.argv) > 2:
+        workers = int(sys.argv[2])
+    else:
+        workers = 1
+    if len(sys.argv) > 3:
+        corpus_path = sys.argv[3]
+    else:
+        corpus_path = None
+    start = time.time()
+    results = run_jobs(jobs, workers)
+    wall_time = time.time() - start
+    pool.close()
+    save_results(results, corpus_path)
+    print_summary(results, wall_time)
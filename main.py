@@ -2,9 +2,9 @@
 # Calvin Pelletier
 # 1/2/16
 
-import music21
-music21.environment.set("musicxmlPath", "/usr/bin/musescore")
-music21.environment.set("midiPath", "/usr/bin/timidity")
+import notation
+notation.set_environment("musicxmlPath", "/usr/bin/musescore")
+notation.set_environment("midiPath", "/usr/bin/timidity")
 import minerva
 
 minerva.run()
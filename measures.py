@@ -0,0 +1,101 @@
+# measures.py
+
+# compares the 8 tick measures of a melody for the rhythmically thematic and repetitive characteristics
+# every measure is encoded once as two integer signatures:
+#   rhythm signature: bit k is set if a note starts on tick k of the measure
+#   pitch signature: 7 bits per tick, the exact degree of a note that starts on that tick, the exact degree plus
+#                    EXTENSION_CODE if the note is held through it, 0 if it's silent
+# measures with the same signature are grouped together, so only distinct signatures are compared (by popcount, on
+# numpy arrays once there are enough of them)
+# pair bonuses are added up as integers (RHYTHM_UNIT and PITCH_UNIT per 1.0) so the totals don't depend on the order
+# the pairs are visited in
+
+import numpy
+import note
+
+TICK_BITS = 7
+LOW_BITS = sum(1 << (TICK_BITS * k) for k in range(8)) # lowest bit of every tick
+EXTENSION_CODE = 64 # separates a held note from the same note starting
+NUMPY_MIN_GROUPS = 32 # below this many distinct measures comparing them one pair at a time is faster
+
+# bonus for a pair of measures by how many ticks they differ in
+#                0   1  2  3  4  5  6  7  8
+RHYTHM_BONUS = [10, 3, 1, 0, 0, 0, 0, 0, 0] # 1.0, 0.3, 0.1
+RHYTHM_UNIT = 10.0
+#                  0     1     2     3     4     5    6    7    8
+PITCH_BONUS = [12600, 4200, 2100, 1400, 1050, 840, 700, 600, 525] # 15.0 if identical, else 5.0 / count
+PITCH_UNIT = 840.0
+
+def measure_count(m):
+    if m.duration() % 8 != 0:
+        raise NameError("Melody duration is not a whole number of measures.")
+    return m.duration() // 8
+
+def rhythm_signatures(m):
+    return [rhythm_signature(m, measure) for measure in range(measure_count(m))]
+
+def pitch_signatures(m):
+    return [pitch_signature(m, measure) for measure in range(measure_count(m))]
+
+def rhythm_signature(m, measure):
+    ret = 0
+    for k in range(8):
+        if m.kinds[8 * measure + k] == note.NOTE:
+            ret |= 1 << k
+    return ret
+
+def pitch_signature(m, measure):
+    ret = 0
+    for k in range(8):
+        pitch = m.pitches[8 * measure + k]
+        if pitch != 0 and m.kinds[8 * measure + k] == note.EXTENSION:
+            pitch += EXTENSION_CODE
+        ret |= pitch << (TICK_BITS * k)
+    return ret
+
+# number of ticks two signatures (or two arrays of signatures) differ in
+def rhythm_mismatch(a, b):
+    return popcount(a ^ b)
+
+def pitch_mismatch(a, b):
+    x = a ^ b
+    # fold every tick's bits onto its lowest bit
+    y = x
+    for k in range(1, TICK_BITS):
+        y = y | (x >> k)
+    return popcount(y & LOW_BITS)
+
+# on arrays the counts are int64, the sum of the unpacked bits is unsigned and numpy.bincount won't take that
+def popcount(x):
+    if isinstance(x, numpy.ndarray):
+        return numpy.unpackbits(x.view(numpy.uint8)).reshape(x.shape + (-1,)).sum(axis=-1).astype(numpy.int64)
+    return bin(x).count('1')
+
+# histogram[count] is the number of pairs of measures that differ in count ticks
+def mismatch_histogram(signatures, mismatch):
+    groups = {}
+    for signature in signatures:
+        groups[signature] = groups.get(signature, 0) + 1
+    histogram = [0] * 9
+    distinct = groups.items()
+    for signature, count in distinct:
+        histogram[0] += count * (count - 1) // 2
+    if len(distinct) < NUMPY_MIN_GROUPS:
+        for i in range(len(distinct)):
+            for j in range(i + 1, len(distinct)):
+                histogram[mismatch(distinct[i][0], distinct[j][0])] += distinct[i][1] * distinct[j][1]
+    else:
+        values = numpy.array([signature for signature, count in distinct], dtype=numpy.uint64)
+        counts = numpy.array([count for signature, count in distinct], dtype=numpy.int64)
+        i, j = numpy.triu_indices(len(distinct), 1)
+        pairs = numpy.bincount(mismatch(values[i], values[j]), weights=counts[i] * counts[j], minlength=9)
+        for count in range(1, 9):
+            histogram[count] += int(pairs[count])
+    return histogram
+
+# sum of pair bonuses in RHYTHM_UNIT or PITCH_UNIT
+def bonus_units(histogram, bonus):
+    total = 0
+    for count in range(len(histogram)):
+        total += bonus[count] * histogram[count]
+    return total
@@ -2,10 +2,16 @@
 # Calvin Pelletier
 # 1/1/16
 
-import music21
-from random import randint, random, seed
+import numpy
+from array import array
+from random import Random, randint, random, seed
 import progression
 import note
+import batch
+import repeats
+import measures
+import pool
+import notation
 
 # melody in string format: x 1,1 - 1,2 - - x x | 3,1
 # | is a measure divider, x is a rest, - is a continuation of the previous note, 1,2 is the 1 note (relative to key) in the 2nd octave
@@ -13,7 +19,17 @@ import note
 # NOTE: EVERYTHING IS HANDLED AS IF IT'S IN THE KEY OF C MAJOR/A MINOR
 # IF IT'S IN A MINOR, 1 STILL REPRESENTS C, BUT ITS CHARACTERISTICS ACCOUNT FOR THE DIFFERENCES BETWEEN C MAJOR AND A MINOR
 
-class Melody:
+# a melody is stored as three parallel arrays with one entry per tick:
+#   kinds: note.NOTE where a note starts, note.REST where a rest starts, note.EXTENSION where either is held
+#   pitches: exact degree of the note sounding on that tick, 0 if it's silent
+#   durations: duration of the note or rest that the tick is part of
+# instants, notes and notes_and_rests (lists of note.Note/Rest/Extension objects) are built from the arrays the first
+# time they're used, they are read only
+
+class Melody(object):
+    __slots__ = ['ID', 'kinds', 'pitches', 'durations', '_instants', '_notes', '_notes_and_rests', 'chord_progression',
+                 'minor', 'rhythmic_style', 'characteristics', 'changed_ticks']
+
     # CONSTANTS FOR NORMALIZING CHARACTERISTICS
     EN_A = 8.5
     EN_B = 6.0
@@ -34,14 +50,27 @@ class Melody:
     SI_A = 50.0
     SI_B = 15.0
 
+    # KEY DISSONANCE (favors 1 and 5 primarily, then the pentatonic scale)
+    #                       1    2    3    4    5    6    7
+    KEY_DISSONANCE_MAJOR = [0.0, 0.4, 0.4, 0.7, 0.2, 0.4, 1.0]
+    KEY_DISSONANCE_MINOR = [0.4, 0.4, 0.2, 0.7, 0.4, 0.0, 1.0]
+
+    # RHYTHMIC STYLES
+    #                 1   and   2   and   3   and   4   and
+    RHYTHMIC_STYLE = [[1.0, 0.0, 0.5, 0.0, 0.7, 0.0, 0.5, 0.0], # style 0
+                      [0.0, 1.0, 0.0, 0.5, 0.0, 0.7, 0.0, 0.5], # style 1
+                      [0.5, 0.0, 1.0, 0.0, 0.5, 0.0, 0.7, 0.0], # style 2
+                      [0.0, 0.5, 0.0, 1.0, 0.0, 5.0, 0.0, 0.7]] # style 3
+
     # INITIALIZATION FUNCTIONS
     def __init__(self, chord_progression=progression.Progression(['I', 'V', 'vi', 'IV']), minor=False, rhythmic_style=0):
         self.ID = "unidentified"
 
         # MELODY
-        self.instants = []
-        self.notes = []
-        self.notes_and_rests = []
+        self.kinds = array('b')
+        self.pitches = array('b')
+        self.durations = array('H')
+        self.on_change()
 
         # HELPER INFORMATION
         self.chord_progression = chord_progression
@@ -60,6 +89,9 @@ class Melody:
         self.characteristics['de'] = None
         self.characteristics['si'] = None
 
+        # MUTATION INFORMATION
+        self.changed_ticks = None # ticks altered by the mutate() call that created this melody
+
     # CHARACTERISTIC FUNCTIONS
     def calculate_characteristics(self):
         self.get_energetic()
@@ -73,218 +105,195 @@ class Melody:
         self.get_silent()
 
     def get_energetic(self):
+        onsets = self.note_ticks()
         total = 0.0
-        for i in range(len(self.notes) - 1):
-            total += abs(note.degree_separation(self.notes[i], self.notes[i+1])) / float(self.notes[i].duration)
-        if len(self.notes) == 0:
+        for i in range(len(onsets) - 1):
+            total += abs(self.pitches[onsets[i + 1]] - self.pitches[onsets[i]]) / float(self.durations[onsets[i]])
+        if len(onsets) == 0:
             self.characteristics['en'] = 0.0
         else:
-            self.characteristics['en'] = self.EN_A * total / float(len(self.notes)) + self.EN_B
+            self.characteristics['en'] = self.EN_A * total / float(len(onsets)) + self.EN_B
 
     def get_progression_dissonant(self):
-        total = 0.0
-        for i in range(len(self.instants)):
-            if isinstance(self.instants[i], note.Note):
-                total += self.chord_progression.chord_at(i).dissonance_of_note(self.instants[i]) * self.instants[i].duration
-            elif isinstance(self.instants[i], note.Extension):
-                if isinstance(self.instants[i].src, note.Note):
-                    total += self.chord_progression.chord_at(i).dissonance_of_note(self.instants[i].src) * self.instants[i].src.duration
-        if len(self.notes) == 0:
+        total = float(self.chord_progression.compile().dissonance_total(self.pitches, self.durations))
+        notes = self.kinds.count(note.NOTE)
+        if notes == 0:
             self.characteristics['pd'] = 0.0
         else:
-            self.characteristics['pd'] = self.PD_A * total / float(len(self.notes)) + self.PD_B
+            self.characteristics['pd'] = self.PD_A * total / float(notes) + self.PD_B
 
     def get_key_dissonant(self):
-        # favors 1 and 5 primarily, then the pentatonic scale
-        #                    1    2    3    4    5    6    7
-        DISSONANCE_MAJOR = [0.0, 0.4, 0.4, 0.7, 0.2, 0.4, 1.0]
-        DISSONANCE_MINOR = [0.4, 0.4, 0.2, 0.7, 0.4, 0.0, 1.0]
-
+        if self.minor:
+            dissonance = self.KEY_DISSONANCE_MINOR
+        else:
+            dissonance = self.KEY_DISSONANCE_MAJOR
+        onsets = self.note_ticks()
         total = 0.0
-        for n in self.notes:
-            if self.minor:
-                total += DISSONANCE_MINOR[n.degree - 1] * n.duration
-            else:
-                total += DISSONANCE_MAJOR[n.degree - 1] * n.duration
-        if len(self.notes) == 0:
+        for i in onsets:
+            total += dissonance[(self.pitches[i] - 1) % 7] * self.durations[i]
+        if len(onsets) == 0:
             self.characteristics['kd'] = 0.0
         else:
-            self.characteristics['kd'] = self.KD_A * total / float(len(self.notes)) + self.KD_B
+            self.characteristics['kd'] = self.KD_A * total / float(len(onsets)) + self.KD_B
 
     def get_rhythmic(self):
-        #                       1   and   2   and   3   and   4   and
-        RHYTHMIC_STYLE = []
-        RHYTHMIC_STYLE.append([1.0, 0.0, 0.5, 0.0, 0.7, 0.0, 0.5, 0.0]) # style 0
-        RHYTHMIC_STYLE.append([0.0, 1.0, 0.0, 0.5, 0.0, 0.7, 0.0, 0.5]) # style 1
-        RHYTHMIC_STYLE.append([0.5, 0.0, 1.0, 0.0, 0.5, 0.0, 0.7, 0.0]) # style 2
-        RHYTHMIC_STYLE.append([0.0, 0.5, 0.0, 1.0, 0.0, 5.0, 0.0, 0.7]) # style 3
-
         total = 0.0
-        for n in self.notes:
-            total += RHYTHMIC_STYLE[self.rhythmic_style][n.location % 8] * n.duration
+        for i in self.note_ticks():
+            total += self.RHYTHMIC_STYLE[self.rhythmic_style][i % 8] * self.durations[i]
         self.characteristics['rh'] = self.RH_A * total / float(self.duration()) + self.RH_B
 
     def get_rhythmically_thematic(self):
-        IDENTICAL_BONUS = 1.0
-        ONE_OFF_BONUS = 0.3
-        TWO_OFF_BONUS = 0.1
-        measures = []
-        total = 0.0
-        for i in range(len(self.instants)):
-            if i % 8 == 0:
-                measures.append([])
-            if isinstance(self.instants[i], note.Note):
-                measures[i / 8].append(1)
-            else:
-                measures[i / 8].append(0)
-        for i in range(len(measures) - 1):
-            for j in range(i + 1, len(measures)):
-                count = 0
-                for k in range(8):
-                    if measures[i][k] != measures[j][k]:
-                        count += 1
-                if count == 0:
-                    total += IDENTICAL_BONUS
-                elif count == 1:
-                    total += ONE_OFF_BONUS
-                elif count == 2:
-                    total += TWO_OFF_BONUS
-        self.characteristics['rt'] = self.RT_A * total / float(len(measures)) + self.RT_B
+        signatures = measures.rhythm_signatures(self)
+        histogram = measures.mismatch_histogram(signatures, measures.rhythm_mismatch)
+        total = measures.bonus_units(histogram, measures.RHYTHM_BONUS) / measures.RHYTHM_UNIT
+        self.characteristics['rt'] = self.RT_A * total / float(len(signatures)) + self.RT_B
 
     def get_tonally_thematic(self):
-        total = 0.0
-        sequences = {}
-        notes = []
-        for n in self.notes:
-            notes.append(n.name_with_octave)
-        for i in range(len(notes) - 1):
-            for j in range(i + 2, len(notes) + 1):
-                sequence = '-'.join(notes[i:j])
-                if sequences.has_key(sequence):
-                    sequences[sequence] += 1
-                else:
-                    sequences[sequence] = 1
-        for key, value in sequences.iteritems():
-            if value > 1:
-                if len(set(key.split('-'))) != 1:
-                    total += float(value)
-        if len(self.notes) == 0:
+        pitches = [self.pitches[i] for i in self.note_ticks()]
+        if len(pitches) == 0:
             self.characteristics['tt'] = 0.0
         else:
-            self.characteristics['tt'] = self.TT_A * total / float(len(self.notes)) + self.TT_B
+            self.characteristics['tt'] = self.TT_A * repeats.repeated_sequences(pitches) / float(len(pitches)) + self.TT_B
 
-    # wrote this when I was way too tired so it's pretty sloppy
-    # TODO: rewrite
     def get_repetitive(self):
-        IDENTICAL = 15.0
-        NON_IDENTICAL = 5.0
-        total = 0.0
-        measures = []
-        for i in range(len(self.instants)):
-            if i % 8 == 0:
-                measures.append([])
-            if isinstance(self.instants[i], note.Note):
-                measures[i / 8].append(self.instants[i].degree_octave_str)
-            elif isinstance(self.instants[i], note.Extension):
-                if isinstance(self.instants[i].src, note.Note):
-                    measures[i / 8].append(self.instants[i].src.degree_octave_str + '-')
-                else:
-                    measures[i / 8].append('x')
-            else:
-                measures[i / 8].append('x')
-        for i in range(len(measures) - 1):
-            for j in range(i + 1, len(measures)):
-                count = 0
-                for k in range(8):
-                    if measures[i][k] != measures[j][k]:
-                        count += 1
-                if count == 0:
-                    total += IDENTICAL
-                else:
-                    total += NON_IDENTICAL / float(count)
-        self.characteristics['re'] = self.RE_A * total / float(len(measures)) + self.RE_B
-
+        signatures = measures.pitch_signatures(self)
+        histogram = measures.mismatch_histogram(signatures, measures.pitch_mismatch)
+        total = measures.bonus_units(histogram, measures.PITCH_BONUS) / measures.PITCH_UNIT
+        self.characteristics['re'] = self.RE_A * total / float(len(signatures)) + self.RE_B
 
     def get_dense(self):
-        self.characteristics['de'] = self.DE_A * len(self.notes) / float(self.duration()) + self.DE_B
+        self.characteristics['de'] = self.DE_A * self.kinds.count(note.NOTE) / float(self.duration()) + self.DE_B
 
     def get_silent(self):
-        total = 0
-        rest = True
-        for instant in self.instants:
-            if isinstance(instant, note.Rest):
-                total += 1
-                rest = True
-            elif isinstance(instant, note.Extension):
-                if rest:
-                    total += 1
-            else:
-                rest = False
-        self.characteristics['si'] = self.SI_A * total / float(self.duration()) + self.SI_B
+        self.characteristics['si'] = self.SI_A * self.pitches.count(0) / float(self.duration()) + self.SI_B
 
     # OTHER FUNCTIONS
     def duration(self):
-        return len(self.instants)
+        return len(self.kinds)
+
+    # ticks where a note starts, in order
+    def note_ticks(self):
+        return [i for i in range(len(self.kinds)) if self.kinds[i] == note.NOTE]
+
+    # called anytime the arrays change
+    def on_change(self):
+        self._instants = None
+        self._notes = None
+        self._notes_and_rests = None
+
+    # sent to other processes (see pool.py) without the views, they're rebuilt when needed
+    def __getstate__(self):
+        names = [name for name in self.__slots__ if not name.startswith('_')]
+        return dict((name, getattr(self, name)) for name in names)
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+        self.on_change()
+
+    @property
+    def instants(self):
+        if self._instants is None:
+            self.build_views()
+        return self._instants
+
+    @property
+    def notes(self):
+        if self._notes is None:
+            self.build_views()
+        return self._notes
+
+    @property
+    def notes_and_rests(self):
+        if self._notes_and_rests is None:
+            self.build_views()
+        return self._notes_and_rests
+
+    def build_views(self):
+        self._instants = []
+        self._notes = []
+        self._notes_and_rests = []
+        cur = None
+        for i in range(len(self.kinds)):
+            if self.kinds[i] == note.EXTENSION:
+                instant = note.Extension(cur)
+            else:
+                if self.kinds[i] == note.NOTE:
+                    cur = note.Note(exact_degree=self.pitches[i], duration=self.durations[i])
+                    self._notes.append(cur)
+                else:
+                    cur = note.Rest(self.durations[i])
+                self._notes_and_rests.append(cur)
+                instant = cur
+            instant.location = i
+            self._instants.append(instant)
 
     def append(self, note_rest):
-        note_rest.location = len(self.instants)
-        self.instants.append(note_rest)
-        self.notes_and_rests.append(note_rest)
+        note_rest.location = len(self.kinds)
         if isinstance(note_rest, note.Note):
-            self.notes.append(note_rest)
-        for i in range(note_rest.duration - 1):
-            extension = note.Extension(note_rest)
-            extension.location = len(self.instants)
-            self.instants.append(extension)
+            self.kinds.append(note.NOTE)
+            pitch = note_rest.exact_degree
+        else:
+            self.kinds.append(note.REST)
+            pitch = 0
+        self.kinds.extend([note.EXTENSION] * (note_rest.duration - 1))
+        self.pitches.extend([pitch] * note_rest.duration)
+        self.durations.extend([note_rest.duration] * note_rest.duration)
+        self.on_change()
 
     def parse(self, string):
         s = string.translate(None, '|')
         s = s.translate(None, ' ')
         if s[0] == '-':
             s = 'x' + s[1:]
-        self.instants = []
-        self.notes = []
-        self.notes_and_rests = []
+        self.kinds = array('b')
+        self.pitches = array('b')
+        self.durations = array('H')
         i = 0
         while i < len(s):
+            old_i = i
             if s[i] == 'x':
-                duration = 1
+                pitch = 0
                 i += 1
-                while True:
-                    if i >= len(s):
-                        break
-                    if s[i] != '-' and s[i] != 'x':
-                        break
-                    duration += 1
+                while i < len(s) and (s[i] == '-' or s[i] == 'x'):
                     i += 1
-                self.append(note.Rest(duration))
+                duration = i - old_i
             else:
-                old_i = i
                 i += 3
-                while True:
-                    if i >= len(s):
-                        break
-                    if s[i] != '-':
-                        break
+                while i < len(s) and s[i] == '-':
                     i += 1
                 try:
-                    self.append(note.Note(string=s[old_i:i]))
-                except:
+                    degree = int(s[old_i])
+                    octave = int(s[old_i + 2])
+                except (ValueError, IndexError):
+                    degree = octave = 0
+                if degree < 1 or degree > 7 or octave < 1 or octave > 7:
                     raise NameError("Tried to create a note from: \'%s\' in string: \'%s\'." % (s[old_i:i], s))
+                pitch = degree + 7 * (octave - 1)
+                duration = i - old_i - 2
+            if pitch == 0:
+                self.kinds.append(note.REST)
+            else:
+                self.kinds.append(note.NOTE)
+            self.kinds.extend([note.EXTENSION] * (duration - 1))
+            self.pitches.extend([pitch] * duration)
+            self.durations.extend([duration] * duration)
+        self.on_change()
 
     def __str__(self):
         ret = ''
-        for note_rest in self.notes_and_rests:
-            if isinstance(note_rest, note.Rest):
-                ret += 'x' * note_rest.duration
+        for i in range(len(self.kinds)):
+            if self.kinds[i] == note.REST:
+                ret += 'x' * self.durations[i]
                 ret += ' '
-            else:
-                ret += str(note_rest.degree) + ',' + str(note_rest.octave)
-                ret += '-' * (note_rest.duration - 1)
+            elif self.kinds[i] == note.NOTE:
+                ret += note.PITCHES[self.pitches[i]].degree_octave_str
+                ret += '-' * (self.durations[i] - 1)
                 ret += ' '
         return ret
 
     def get_music21(self, repeat=2):
+        music21 = notation.music21()
         m = music21.stream.Part()
         m.insert(music21.instrument.Piano())
         for i in range(repeat):
@@ -317,9 +326,11 @@ class Melody:
                 total += (value - target.characteristics[key][1])**2
         return total
 
+    # edits the arrays directly (on a copy of them unless in_place), without going through the string format
     def mutate(self, in_place=False):
-        UPPER_NOTE_BOUND = note.Note(string='5,5')
-        LOWER_NOTE_BOUND = note.Note(string='5,3')
+        UPPER_NOTE_BOUND = note.pitch_from_string('5,5').exact_degree
+        LOWER_NOTE_BOUND = note.pitch_from_string('5,3').exact_degree
+        DEFAULT_NOTE = note.pitch_from_string('1,4').exact_degree
         CHANCE_OF_ALTERING = 0.2
         CHANCE_OF_REST = 0.05
         CHANCE_OF_EXTENSION = 0.55
@@ -328,49 +339,112 @@ class Melody:
         CHANCE_OF_MOVEMENT = [0.00, 0.00, 0.05, 0.05, 0.10, 0.10, 0.15, 0.10, 0.15, 0.10, 0.10, 0.05, 0.05, 0.00, 0.00]
 
         #seed()
-        new_instants = self.instants
         last_note = None
-        string = ''
-        for instant in new_instants:
-            if isinstance(instant, note.Note):
-                last_note = note.Note(degree=instant.degree, octave=instant.octave)
+        edits = []
+        for tick in range(self.duration()):
+            kind = self.kinds[tick]
+            if kind == note.NOTE:
+                last_note = self.pitches[tick]
             if random() < CHANCE_OF_ALTERING:
                 rand = random()
                 if rand < CHANCE_OF_REST:
-                    instant = note.Rest()
+                    edit = (tick, note.REST, 0)
                 elif rand < CHANCE_OF_REST + CHANCE_OF_EXTENSION:
-                    instant = note.Extension(None)
+                    edit = (tick, note.EXTENSION, 0)
                 else:
-                    if isinstance(instant, note.Rest) or isinstance(instant, note.Extension):
-                        if last_note is None:
-                            last_note = note.Note(string='1,4')
-                        instant = note.Note(degree=last_note.degree, octave=last_note.octave)
+                    if last_note is None:
+                        last_note = DEFAULT_NOTE
                     while True:
                         rand = random()
                         i = 0
                         while rand > CHANCE_OF_MOVEMENT[i]:
                             rand -= CHANCE_OF_MOVEMENT[i]
                             i += 1
-                        new_instant = instant.transpose(i - 7, in_place=False)
-                        if new_instant > LOWER_NOTE_BOUND and new_instant < UPPER_NOTE_BOUND:
+                        pitch = last_note + i - 7
+                        if pitch > LOWER_NOTE_BOUND and pitch < UPPER_NOTE_BOUND:
                             break
-                    instant = new_instant
-            if isinstance(instant, note.Note):
-                string += str(instant.degree) + ',' + str(instant.octave)
-            elif isinstance(instant, note.Rest):
-                string += 'x'
-            elif isinstance(instant, note.Extension):
-                string += '-'
-            else:
-                raise NameError("Something went horribly wrong.")
+                    edit = (tick, note.NOTE, pitch)
+                if edit[1] != kind or (kind == note.NOTE and edit[2] != self.pitches[tick]):
+                    edits.append(edit)
         if in_place:
-            self.parse(string)
+            ret = self
         else:
             ret = Melody(chord_progression=self.chord_progression, minor=self.minor, rhythmic_style=self.rhythmic_style)
             ret.ID = self.ID
-            ret.parse(string)
+            ret.kinds = self.kinds[:]
+            ret.pitches = self.pitches[:]
+            ret.durations = self.durations[:]
+        merged = ret.edit(edits)
+        ret.changed_ticks = sorted([e[0] for e in edits] + merged)
+        if not in_place:
             return ret
 
+    # sets ticks to new values, edits is a list of (tick, kind, pitch) in order of tick
+    # the notes and rests around the edits are then fixed up the same way parse() would read them: a rest runs
+    # through any rests and extensions after it, an extension at the very start is a rest
+    # returns the ticks where two rests were merged into one
+    def edit(self, edits):
+        for tick, kind, pitch in edits:
+            self.kinds[tick] = kind
+            self.pitches[tick] = pitch
+        fixed = 0
+        for tick, kind, pitch in edits:
+            if tick < fixed:
+                continue
+            # start from the note before the edit, it may now end earlier or later
+            start = tick
+            while start > fixed:
+                start -= 1
+                if self.kinds[start] == note.NOTE:
+                    break
+            fixed = start
+            while fixed < len(self.kinds) and fixed <= tick:
+                fixed = self.fix_event(fixed)
+        # append() can leave rests right after each other, parse() would read them as one rest
+        merged = []
+        tick = 1
+        while tick < len(self.kinds):
+            if self.kinds[tick] == note.REST and self.pitches[tick - 1] == 0:
+                merged.append(tick)
+                tick = self.fix_event(tick - self.durations[tick - 1])
+            else:
+                tick += 1
+        self.on_change()
+        return merged
+
+    # rewrites the pitches and durations of the note or rest starting at tick, returns the tick after it
+    def fix_event(self, tick):
+        end = tick + 1
+        if self.kinds[tick] == note.NOTE:
+            while end < len(self.kinds) and self.kinds[end] == note.EXTENSION:
+                end += 1
+            pitch = self.pitches[tick]
+        else:
+            self.kinds[tick] = note.REST
+            while end < len(self.kinds) and self.kinds[end] != note.NOTE:
+                self.kinds[end] = note.EXTENSION
+                end += 1
+            pitch = 0
+        for i in range(tick, end):
+            self.pitches[i] = pitch
+            self.durations[i] = end - tick
+        return end
+
+    # new melody with the first measures of this one and the rest of other, both must be the same length
+    # a note held over the cut in other carries on the last note or rest of this one
+    def crossover(self, other, measure):
+        if self.duration() != other.duration():
+            raise NameError("Can't cross over melodies of different lengths.")
+        cut = 8 * measure
+        ret = Melody(chord_progression=self.chord_progression, minor=self.minor, rhythmic_style=self.rhythmic_style)
+        ret.ID = self.ID
+        ret.kinds = self.kinds[:cut] + other.kinds[cut:]
+        ret.pitches = self.pitches[:cut] + other.pitches[cut:]
+        ret.durations = self.durations[:cut] + other.durations[cut:]
+        if cut < ret.duration():
+            ret.edit([(cut, ret.kinds[cut], ret.pitches[cut])])
+        return ret
+
 # each characteristic should either be None or a range in form [LOWER_BOUND, UPPER_BOUND]
 class Target:
     def __init__(self, en=None, pd=None, kd=None, rh=None, rt=None, tt=None, re=None, de=None, si=None):
@@ -385,30 +459,184 @@ class Target:
         self.characteristics['de'] = de
         self.characteristics['si'] = si
 
-def genetic_algorithm(target, ancestor, generations, num_offspring):
+    def compile(self):
+        return CompiledTarget(self)
+
+# a Target with its bounds checked once, for scoring lots of melodies against it
+# characteristics are calculated and added to the distance cheapest first (tt, the only one that isn't a few array
+# operations, last) and the ones that are None in the target are never calculated
+class CompiledTarget:
+    COST_ORDER = ['de', 'si', 'kd', 'rh', 'pd', 'en', 'rt', 're', 'tt']
+    EXPENSIVE = ['tt']
+
+    def __init__(self, target):
+        self.bounds = [] # (key, lower bound, upper bound) in COST_ORDER
+        for key in self.COST_ORDER:
+            bounds = target.characteristics[key]
+            if bounds is None:
+                continue
+            if bounds[0] > bounds[1]:
+                raise NameError("Wrong ordering of target bounds.")
+            self.bounds.append((key, bounds[0], bounds[1]))
+        # groups of characteristics calculated together before checking distances against the bound
+        cheap = [b for b in self.bounds if b[0] not in self.EXPENSIVE]
+        expensive = [b for b in self.bounds if b[0] in self.EXPENSIVE]
+        self.stages = [stage for stage in [cheap, expensive] if len(stage) != 0]
+        self.keys = [b[0] for b in self.bounds]
+
+    # distance of a melody whose characteristics in the target are already calculated
+    def distance(self, m):
+        return self.add_distance(0.0, m, self.bounds)
+
+    def add_distance(self, total, m, bounds):
+        for key, lower, upper in bounds:
+            value = m.characteristics[key]
+            if value < lower:
+                total += (lower - value)**2
+            elif value > upper:
+                total += (value - upper)**2
+        return total
+
+    # calculates the characteristics of the melodies (with calculate, which takes a list of melodies and a list of
+    # characteristics) and returns their distances
+    # if bound is given, melodies stop being scored once their distance so far is at least bound, their distance is
+    # None
+    def score(self, melodies, bound=None, calculate=batch.calculate_characteristics):
+        distances = [0.0] * len(melodies)
+        alive = range(len(melodies))
+        for stage in self.stages:
+            if len(alive) == 0:
+                break
+            calculate([melodies[i] for i in alive], [bounds[0] for bounds in stage])
+            for i in alive:
+                distances[i] = self.add_distance(distances[i], melodies[i], stage)
+            if bound is not None:
+                alive = [i for i in alive if distances[i] < bound]
+        alive = set(alive)
+        return [distances[i] if i in alive else None for i in range(len(melodies))]
+
+    # index and distance of the first of the closest melodies that are closer than bound, (None, bound) if none are
+    def best(self, melodies, bound, calculate=batch.calculate_characteristics):
+        ret = None
+        for i, distance in enumerate(self.score(melodies, bound, calculate)):
+            if distance is not None and bound > distance:
+                ret = i
+                bound = distance
+        return ret, bound
+
+    # calculates whatever characteristics of m are still missing
+    def complete(self, m):
+        if None in m.characteristics.values():
+            batch.calculate_characteristics([m])
+
+# workers > 1 creates and scores the offspring of each generation on a process pool (see pool.py)
+# master_seed seeds the whole run: every child is mutated from its own seed, drawn from the master seed, so the result
+# is the same whatever the number of workers (without a master seed and workers a single process mutates the children
+# one after another from the random module, as it always has)
+# cache (a fitness.FitnessCache) skips scoring children that were already scored, it's only used without workers
+# the run stops early once the parent reaches the target, or, if patience is given, once the parent hasn't gotten
+# closer for patience generations
+# children only get the characteristics the target needs (see CompiledTarget), the returned melody has all of them
+def genetic_algorithm(target, ancestor, generations, num_offspring, workers=1, master_seed=None, cache=None,
+                      patience=None):
+    compiled = target.compile()
+    if master_seed is not None:
+        seed(master_seed)
     if ancestor is None:
         parent = create_random_melody()
         parent.calculate_characteristics()
     else:
         parent = ancestor
+        compiled.complete(parent)
     if generations == 0 or num_offspring == 0:
         return parent
+    if cache is None:
+        calculate = batch.calculate_characteristics
+    else:
+        cache.put(parent)
+        calculate = cache.calculate_characteristics
+    if workers > 1 or master_seed is not None:
+        rng = Random(randint(0, pool.MAX_SEED))
+    if workers > 1:
+        workers_pool = pool.get(workers)
+    distance = compiled.distance(parent)
+    flat = 0
     for i in range(generations):
-        best = parent
-        children = []
-        for j in range(num_offspring):
-            children.append(parent.mutate())
-            children[-1].calculate_characteristics()
-            if best.distance_to_target(target) > children[-1].distance_to_target(target):
-                best = children[-1]
-        parent = best
-        children = []
+        if distance == 0.0 or (patience is not None and flat >= patience):
+            break
+        if workers > 1:
+            seeds = pool.child_seeds(rng, num_offspring)
+            best, best_distance = pool.best_offspring(workers_pool, workers, parent, compiled, distance, seeds)
+        else:
+            if master_seed is not None:
+                children = pool.seeded_children(parent, pool.child_seeds(rng, num_offspring))
+            else:
+                children = []
+                for j in range(num_offspring):
+                    children.append(parent.mutate())
+            best, best_distance = compiled.best(children, distance, calculate)
+            if best is not None:
+                best = children[best]
+        if best is None:
+            flat += 1
+        else:
+            flat = 0
+            parent = best
+            distance = best_distance
+    compiled.complete(parent)
     return parent
 
+# population based alternative to genetic_algorithm: every generation keeps the elites best melodies and fills the
+# rest of the population with mutated children of tournament winners, most of them crossed over with a second winner
+def population_genetic_algorithm(target, ancestor, generations, population_size, tournament_size=6, elites=3):
+    for best, evaluations in population_generations(target, ancestor, population_size, tournament_size, elites):
+        generations -= 1
+        if generations < 0:
+            break
+    target.compile().complete(best)
+    return best
+
+# yields (best melody, number of melodies scored so far) once for the starting population and then after every
+# generation, forever
+# melodies only get the characteristics the target needs (see CompiledTarget)
+def population_generations(target, ancestor, population_size, tournament_size=6, elites=3):
+    CHANCE_OF_CROSSOVER = 0.7
+
+    compiled = target.compile()
+    if ancestor is None:
+        population = [create_random_melody() for i in range(population_size)]
+    else:
+        population = [ancestor] + [ancestor.mutate() for i in range(population_size - 1)]
+    distances = compiled.score(population)
+    evaluations = population_size
+    while True:
+        ranked = sorted(range(population_size), key=lambda i: distances[i])
+        yield population[ranked[0]], evaluations
+        children = []
+        while len(children) < population_size - elites:
+            a = population[tournament(distances, tournament_size)]
+            if random() < CHANCE_OF_CROSSOVER:
+                b = population[tournament(distances, tournament_size)]
+                if a.duration() == b.duration() and a.duration() >= 16:
+                    a = a.crossover(b, randint(1, a.duration() // 8 - 1))
+            children.append(a.mutate())
+        evaluations += len(children)
+        population = [population[i] for i in ranked[:elites]] + children
+        distances = [distances[i] for i in ranked[:elites]] + compiled.score(children)
+
+# index of the closest of tournament_size randomly picked melodies
+def tournament(distances, tournament_size):
+    ret = randint(0, len(distances) - 1)
+    for i in range(tournament_size - 1):
+        j = randint(0, len(distances) - 1)
+        if distances[j] < distances[ret]:
+            ret = j
+    return ret
+
 def create_random_melody(measures=4, chord_progression=progression.Progression(['I', 'V', 'vi', 'IV'])):
     MAX_RANGE = 13 # in degrees
-    UPPER_NOTE_BOUND = note.Note(string='5,5')
-    LOWER_NOTE_BOUND = note.Note(string='5,3')
+    UPPER_NOTE_BOUND = note.pitch_from_string('5,5').exact_degree
+    LOWER_NOTE_BOUND = note.pitch_from_string('5,3').exact_degree
     POSSIBLE_START_NOTES = ['1,4', '2,4', '3,4', '4,4', '5,4', '6,4', '7,4', '1,5']
     CHANCE_OF_REST = 0.1
     CHANCE_OF_EXTENSION = 0.5
@@ -427,29 +655,30 @@ def create_random_melody(measures=4, chord_progression=progression.Progression([
     while random() < CHANCE_OF_EXTENSION:
         start_note.duration += 1
     ret.append(start_note)
-    lowest_note = start_note
-    highest_note = start_note
+    # exact degrees, the note is only made once its pitch is in range
+    last_note = start_note.exact_degree
+    lowest_note = last_note
+    highest_note = last_note
     while True:
         rand = random()
         if rand < CHANCE_OF_REST:
             cur = note.Rest()
         else:
-            upper_bound = min(UPPER_NOTE_BOUND, lowest_note.transpose(MAX_RANGE, in_place=False))
-            lower_bound = max(LOWER_NOTE_BOUND, highest_note.transpose(MAX_RANGE * -1, in_place=False))
+            upper_bound = min(UPPER_NOTE_BOUND, lowest_note + MAX_RANGE)
+            lower_bound = max(LOWER_NOTE_BOUND, highest_note - MAX_RANGE)
             while True:
-                cur = note.Note(exact_degree=ret.notes[-1].exact_degree)
                 rand = random()
                 i = 0
                 while rand > CHANCE_OF_MOVEMENT[i]:
                     rand -= CHANCE_OF_MOVEMENT[i]
                     i += 1
-                cur.transpose(i - 7)
-                if cur < upper_bound and cur > lower_bound:
+                pitch = last_note + i - 7
+                if pitch < upper_bound and pitch > lower_bound:
                     break
-            if cur < lowest_note:
-                lowest_note = cur
-            if cur > highest_note:
-                highest_note = cur
+            cur = note.Note(exact_degree=pitch)
+            lowest_note = min(lowest_note, pitch)
+            highest_note = max(highest_note, pitch)
+            last_note = pitch
         while random() < CHANCE_OF_EXTENSION:
             cur.duration += 1
         if ret.duration() + cur.duration >= length:
@@ -460,11 +689,92 @@ def create_random_melody(measures=4, chord_progression=progression.Progression([
 
     return ret
 
+# n melodies drawn from the same distribution as create_random_melody, all generated together with numpy
+# every step adds one note or rest to all the melodies that aren't full yet, a note's movement is drawn straight from
+# CHANCE_OF_MOVEMENT cut down to the moves that stay inside the range (instead of drawing until one does)
+def create_random_melody_batch(n, measures=4, chord_progression=progression.Progression(['I', 'V', 'vi', 'IV']),
+                               seed=None):
+    kinds, pitches, durations, minor = random_melody_arrays(n, measures, seed)
+    ret = []
+    for i in range(n):
+        m = Melody(chord_progression=chord_progression, minor=bool(minor[i]))
+        m.kinds = array('b', kinds[i].tostring())
+        m.pitches = array('b', pitches[i].tostring())
+        m.durations = array('H', durations[i].tostring())
+        ret.append(m)
+    return ret
+
+# kinds, pitches and durations (n x ticks numpy arrays in the same form as a melody's arrays) and minor (n booleans)
+def random_melody_arrays(n, measures=4, seed=None):
+    # same as create_random_melody
+    MAX_RANGE = 13 # in degrees
+    UPPER_NOTE_BOUND = note.pitch_from_string('5,5').exact_degree
+    LOWER_NOTE_BOUND = note.pitch_from_string('5,3').exact_degree
+    POSSIBLE_START_NOTES = [note.pitch_from_string(s).exact_degree for s in ['1,4', '2,4', '3,4', '4,4', '5,4', '6,4', '7,4', '1,5']]
+    CHANCE_OF_REST = 0.1
+    CHANCE_OF_EXTENSION = 0.5
+    MINOR_CHANCE = 0.5
+    #                      -7    -6    -5    -4    -3    -2     -1    0    +1    +2    +3    +4    +5    +6    +7
+    CHANCE_OF_MOVEMENT = [0.05, 0.05, 0.05, 0.05, 0.05, 0.10, 0.10, 0.10, 0.10, 0.10, 0.05, 0.05, 0.05, 0.05, 0.05]
+
+    rng = numpy.random.RandomState(seed)
+    length = 8 * measures
+    moves = numpy.arange(-7, 8)
+    chance_of_movement = numpy.array(CHANCE_OF_MOVEMENT)
+    minor = rng.random_sample(n) < MINOR_CHANCE
+    last = numpy.array(POSSIBLE_START_NOTES)[rng.randint(0, len(POSSIBLE_START_NOTES), n)]
+    lowest = last.copy()
+    highest = last.copy()
+    # one row per step: what each melody added (a duration of 0 once it's full)
+    event_kinds = [numpy.full(n, note.NOTE)]
+    event_pitches = [last.copy()]
+    event_durations = [numpy.minimum(rng.geometric(1.0 - CHANCE_OF_EXTENSION, n), length)]
+    filled = event_durations[0].copy()
+    while (filled < length).any():
+        active = filled < length
+        rest = rng.random_sample(n) < CHANCE_OF_REST
+        upper_bound = numpy.minimum(UPPER_NOTE_BOUND, lowest + MAX_RANGE)
+        lower_bound = numpy.maximum(LOWER_NOTE_BOUND, highest - MAX_RANGE)
+        candidates = last[:, numpy.newaxis] + moves
+        allowed = (candidates > lower_bound[:, numpy.newaxis]) & (candidates < upper_bound[:, numpy.newaxis])
+        cumulative = numpy.cumsum(numpy.where(allowed, chance_of_movement, 0.0), axis=1)
+        rand = rng.random_sample(n) * cumulative[:, -1]
+        pitch = last + moves[(cumulative <= rand[:, numpy.newaxis]).sum(axis=1)]
+        played = active & ~rest
+        last = numpy.where(played, pitch, last)
+        lowest = numpy.minimum(lowest, last)
+        highest = numpy.maximum(highest, last)
+        duration = numpy.minimum(rng.geometric(1.0 - CHANCE_OF_EXTENSION, n), length - filled)
+        event_kinds.append(numpy.where(rest, note.REST, note.NOTE))
+        event_pitches.append(numpy.where(rest, 0, pitch))
+        event_durations.append(numpy.where(active, duration, 0))
+        filled += event_durations[-1]
+
+    # every event's values repeated over its ticks, melody by melody
+    event_kinds = numpy.array(event_kinds).T.ravel()
+    event_pitches = numpy.array(event_pitches).T.ravel()
+    event_durations = numpy.array(event_durations).T.ravel()
+    kinds = numpy.full(n * length, note.EXTENSION, dtype=numpy.int8)
+    starts = numpy.cumsum(event_durations) - event_durations
+    kinds[starts[event_durations > 0]] = event_kinds[event_durations > 0]
+    pitches = numpy.repeat(event_pitches, event_durations).astype(numpy.int8)
+    durations = numpy.repeat(event_durations, event_durations).astype(numpy.uint16)
+    return kinds.reshape(n, length), pitches.reshape(n, length), durations.reshape(n, length), minor
+
+# yields n random melodies with their characteristics, scored batch_size at a time, without keeping them
+# (generated with create_random_melody_batch, seeded from the random module)
+def generate_random_melodies(n, batch_size=1000, measures=4):
+    for start in range(0, n, batch_size):
+        melodies = create_random_melody_batch(min(batch_size, n - start), measures, seed=randint(0, pool.MAX_SEED))
+        batch.calculate_characteristics(melodies)
+        for m in melodies:
+            yield m
+
 def create_random_melodies(n, sort_by='none'):
     melodies = []
     for i in range(n):
         melodies.append(create_random_melody())
-        melodies[-1].calculate_characteristics()
+    batch.calculate_characteristics(melodies)
     sorted_melodies = []
     if sort_by == 'energy':
         sorted_melodies = sorted(melodies, key=lambda melody:melody.energy)
@@ -0,0 +1,125 @@
+# midi.py
+
+# standard midi files written straight from a melody's arrays, without building music21 streams
+# a file has the same notes as Melody.get_music21: the melody moved up 5 half steps (into F major) and played repeat
+# times on one track, its chord progression on another with every chord held for a measure (looped until it covers the
+# melody) and voiced the way Chord.get_music21 voices it
+# write_melodies renders many melodies at once on the process pool (see pool.py)
+
+import os
+import struct
+import note
+import pool
+
+TICKS_PER_QUARTER = 480
+TICKS_PER_EIGHTH = TICKS_PER_QUARTER / 2 # one tick of a melody
+TEMPO = 500000 # microseconds per quarter note (120 bpm, music21's default)
+TRANSPOSITION = 5 # half steps, like Melody.get_music21
+CHORD_DURATION = 8 # ticks of a melody
+MELODY_VELOCITY = 90
+CHORD_VELOCITY = 49 # piano, like the dynamic Progression.get_music21 adds
+PIANO = 0 # general midi program
+
+# half steps above C of each degree of the key (1 to 7)
+HALF_STEPS = [0, 2, 4, 5, 7, 9, 11]
+
+# midi note number of each exact degree after the transposition, MIDI_NUMBERS[exact_degree]
+MIDI_NUMBERS = [None] + [12 * (p.octave + 1) + HALF_STEPS[p.degree - 1] + TRANSPOSITION for p in note.PITCHES[1:]]
+
+# midi note numbers of each chord, the pitches of the music21 chords Chord.get_music21 makes
+VOICINGS = {}
+VOICINGS['I']   = [65, 69, 72]
+VOICINGS['ii']  = [67, 70, 74]
+VOICINGS['iii'] = [69, 72, 76]
+VOICINGS['III'] = [69, 73, 76]
+VOICINGS['IV']  = [77, 82, 86]
+VOICINGS['V']   = [76, 79, 84]
+VOICINGS['vi']  = [77, 81, 86]
+
+CHUNK = struct.Struct('>4sI')
+HEADER = struct.Struct('>HHH') # format, number of tracks, ticks per quarter note
+EVENT = struct.Struct('>BBB') # status, note number, velocity
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+SET_TEMPO = '\xff\x51\x03'
+END_OF_TRACK = '\xff\x2f\x00'
+
+# the midi file (a string) of a melody
+def melody_to_midi(m, repeat=2):
+    length = m.duration()
+    melody_notes = []
+    for r in range(repeat):
+        for i in m.note_ticks():
+            melody_notes.append((r * length + i, m.durations[i], MIDI_NUMBERS[m.pitches[i]]))
+    chord_notes = []
+    numerals = [c.numeral for c in m.chord_progression.p]
+    tick = 0
+    while len(numerals) != 0 and tick < repeat * length:
+        for numeral in numerals:
+            for number in VOICINGS[numeral]:
+                chord_notes.append((tick, CHORD_DURATION, number))
+            tick += CHORD_DURATION
+    tracks = [track(melody_notes, 0, MELODY_VELOCITY, tempo=True), track(chord_notes, 1, CHORD_VELOCITY)]
+    return CHUNK.pack('MThd', HEADER.size) + HEADER.pack(1, len(tracks), TICKS_PER_QUARTER) + ''.join(tracks)
+
+def write_melody(m, path, repeat=2):
+    f = open(path, 'wb')
+    f.write(melody_to_midi(m, repeat))
+    f.close()
+
+# a track chunk playing notes, given as (start, duration, midi note number) in ticks of a melody, on a channel
+def track(notes, channel, velocity, tempo=False):
+    events = []
+    for start, duration, number in notes:
+        # at the same time a note ends before the next one starts
+        events.append((start + duration, 0, NOTE_OFF | channel, number, 0))
+        events.append((start, 1, NOTE_ON | channel, number, velocity))
+    events.sort()
+    data = []
+    if tempo:
+        data.append(variable_length(0) + SET_TEMPO + struct.pack('>I', TEMPO)[1:])
+    data.append(variable_length(0) + chr(PROGRAM_CHANGE | channel) + chr(PIANO))
+    last = 0
+    for time, order, status, number, vel in events:
+        data.append(variable_length((time - last) * TICKS_PER_EIGHTH) + EVENT.pack(status, number, vel))
+        last = time
+    data.append(variable_length(0) + END_OF_TRACK)
+    data = ''.join(data)
+    return CHUNK.pack('MTrk', len(data)) + data
+
+# a midi variable length quantity, 7 bits per byte with the most significant first
+def variable_length(n):
+    ret = chr(n & 0x7f)
+    n >>= 7
+    while n > 0:
+        ret = chr(0x80 | (n & 0x7f)) + ret
+        n >>= 7
+    return ret
+
+# BATCH EXPORT
+# a .mid file for each melody in folder, named after its ID without the extension (followed by the melody's index if
+# an earlier melody had the same name, like melodies that were never named), rendered by workers processes
+# returns the paths written, in the order of the melodies
+def write_melodies(melodies, folder, workers=1, repeat=2):
+    CHUNK_SIZE = 50 # melodies sent to a worker at a time
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    tasks = []
+    names = set()
+    for i, m in enumerate(melodies):
+        name = os.path.splitext(m.ID)[0]
+        if name in names:
+            name += '_%d' % i
+        names.add(name)
+        tasks.append((m, os.path.join(folder, name + '.mid'), repeat))
+    if workers == 1:
+        return [_write(task) for task in tasks]
+    return pool.get(workers).map(_write, tasks, CHUNK_SIZE)
+
+# runs in the workers
+def _write(task):
+    m, path, repeat = task
+    write_melody(m, path, repeat)
+    return path
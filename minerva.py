@@ -5,11 +5,20 @@
 import melody
 import i_o
 import analysis
-import music21
+import pool
+import fitness
+import sidecar
+import calibrate
+import corpus
+import midi
+import multiprocessing
 import os
 import sys
+import time
 #import song
 
+WORKERS = multiprocessing.cpu_count() # for scoring melodies that aren't in a song folder's sidecar
+
 def run():
     while True:
         command = raw_input("Enter command: ")
@@ -24,6 +33,10 @@ def run():
             break
         elif command == "load":
             load()
+        elif command == "calibrate":
+            calibrate_constants()
+        elif command == "export":
+            export()
         else:
             print("Unidentified command.")
         #except:
@@ -32,13 +45,16 @@ def run():
 
 def analyze_characteristics():
     n = int(raw_input("Of how many random melodies?: "))
-    melodies = melody.create_random_melodies(n)
-    analysis.analyze_characteristics(melodies)
+    analysis.analyze_characteristics(melody.generate_random_melodies(n))
+
+def calibrate_constants():
+    n = int(raw_input("Of how many random melodies?: "))
+    calibrate.run(n, WORKERS)
 
 def analyze_examples():
     melodies = i_o.melodies_from_sample_folder()
+    sidecar.calculate_characteristics(os.path.join(sys.path[0], "sample-songs"), melodies, WORKERS)
     for m in melodies:
-        m.calculate_characteristics()
         m.print_characteristics()
         print("")
 
@@ -46,19 +62,26 @@ def genetic():
     target = set_target()
     generations = int(raw_input("Generations?: "))
     offspring = int(raw_input("Offspring?: "))
-    result = melody.genetic_algorithm(target, None, generations, offspring)
-    result.print_characteristics()
+    workers = int(raw_input("Workers?: "))
+    master_seed = set_seed()
+    cache = fitness.FitnessCache()
+    result = evolve(target, None, generations, offspring, workers, master_seed, cache)
     while True:
         command = raw_input("Done. Now what?: ")
         if command == "play":
             play(result)
         elif command == "quit":
             print("Going back to menu...")
+            pool.close()
             break
         elif command == "set generations":
             generations = int(raw_input("Generations?: "))
         elif command == "set offspring":
             offspring = int(raw_input("Offspring?: "))
+        elif command == "set workers":
+            workers = int(raw_input("Workers?: "))
+        elif command == "set seed":
+            master_seed = set_seed()
         elif command == "set target":
             target = set_target()
         elif command == "save":
@@ -67,24 +90,39 @@ def genetic():
         elif command == "show":
             show(result)
         elif command == "repeat":
-            result = melody.genetic_algorithm(target, result, generations, offspring)
-            result.print_characteristics()
+            result = evolve(target, result, generations, offspring, workers, master_seed, cache)
         elif command == "repeat fresh":
-            result = melody.genetic_algorithm(target, None, generations, offspring)
-            result.print_characteristics()
+            result = evolve(target, None, generations, offspring, workers, master_seed, cache)
         else:
             print("Unidentified command.")
 
+# every melody in a song folder or a corpus file into .mid files
+def export():
+    source = os.path.join(sys.path[0], raw_input("Song folder or corpus file?: "))
+    folder = os.path.join(sys.path[0], raw_input("Into folder?: "))
+    if os.path.isdir(source):
+        melodies = [i_o.melody_from_txt_file(os.path.join(source, filename)) for filename in i_o.song_files(source)]
+    else:
+        c = corpus.Corpus(source)
+        melodies = c.melodies()
+        c.close()
+    start = time.time()
+    paths = midi.write_melodies(melodies, folder, WORKERS)
+    pool.close()
+    print("Wrote %d midi files to %s in %.2fs." % (len(paths), folder, time.time() - start))
+
 def load():
     filepath = raw_input("Filepath?: ")
     if filepath == "generated-songs":
         melodies = i_o.melodies_from_generated_folder()
+        folder = os.path.join(sys.path[0], "generated-songs")
     else:
         melodies = []
         melodies.append(i_o.melody_from_txt_file(os.path.join(sys.path[0], filepath)))
+        folder = os.path.dirname(os.path.join(sys.path[0], filepath))
+    sidecar.calculate_characteristics(folder, melodies, WORKERS)
     for i, m in enumerate(melodies):
         print("~~~~~%d~~~~~" % i)
-        m.calculate_characteristics()
         m.print_characteristics()
     while True:
         command = raw_input("Done. Now what?: ")
@@ -110,6 +148,23 @@ def set_target():
             target.characteristics[key] = [float(x) for x in val.split('-')]
     return target
 
+# blank for no seed
+def set_seed():
+    val = raw_input("Master seed?: ")
+    if val == '':
+        return None
+    return int(val)
+
+# runs the genetic algorithm and prints the result, the cache is only used with one worker
+def evolve(target, ancestor, generations, offspring, workers, master_seed, cache):
+    result = melody.genetic_algorithm(target, ancestor, generations, offspring, workers, master_seed, cache)
+    result.print_characteristics()
+    if workers > 1:
+        print("Fitness cache: not used with more than one worker")
+    else:
+        print("Fitness cache: %s" % cache)
+    return result
+
 def play(m):
     m.get_music21().show('midi')
 
@@ -0,0 +1,29 @@
+# notation.py
+
+# music21 is only needed to show and play melodies, so it's imported the first time one of the get_music21 methods
+# asks for it instead of by every module that has one
+# scoring, mutating, progressions, i/o and the worker processes never load it
+# environment settings (like main.py's) are kept until music21 is loaded and then set
+
+_music21 = None
+_settings = []
+
+# the music21 module, imported on the first call
+def music21():
+    global _music21
+    if _music21 is None:
+        import music21 as m21
+        for key, value in _settings:
+            m21.environment.set(key, value)
+        _music21 = m21
+    return _music21
+
+# music21.environment.set(key, value), now if music21 is loaded or when it is
+def set_environment(key, value):
+    if _music21 is None:
+        _settings.append((key, value))
+    else:
+        _music21.environment.set(key, value)
+
+def loaded():
+    return _music21 is not None
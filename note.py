@@ -29,56 +29,103 @@
 #   init (object that this is an extension of):
 #       Extension(myNote)
 # Other:
+#  REST, NOTE, EXTENSION (kind of a tick in the array form of a melody)
 #  degree_separation (returns value in degrees, takes two Note objects as input, positive means second note is higher):
 #       num = note.degree_separation(myNote, myOtherNote)
+#  PITCHES (every pitch a note can have, indexed by exact degree, shared by all notes):
+#       myPitch = note.PITCHES[34]
+#       myPitch = note.pitch_from_string("1,5")
+#       myOtherPitch = myPitch.transpose(-3)
 
-import music21
+import notation
+
+# kind of each tick when a melody is stored as arrays
+REST = 0
+NOTE = 1
+EXTENSION = 2
+
+NAMES = ['C', 'D', 'E', 'F', 'G', 'A', 'B']
+
+# one of the 49 pitches (7 degrees in each of 7 octaves), made once with its names when this module is loaded and
+# never changed, so notes can share them instead of rebuilding the strings every time they're created or transposed
+class Pitch(object):
+    __slots__ = ['degree', 'octave', 'exact_degree', 'degree_octave_str', 'name', 'name_with_octave']
+
+    def __init__(self, exact_degree):
+        object.__setattr__(self, 'exact_degree', exact_degree)
+        object.__setattr__(self, 'degree', (exact_degree - 1) % 7 + 1)
+        object.__setattr__(self, 'octave', (exact_degree - 1) / 7 + 1)
+        object.__setattr__(self, 'degree_octave_str', str(self.degree) + ',' + str(self.octave))
+        object.__setattr__(self, 'name', NAMES[self.degree - 1])
+        object.__setattr__(self, 'name_with_octave', self.name + str(self.octave))
+
+    def __setattr__(self, key, value):
+        raise NameError("Pitches can't be changed.")
+
+    # copies and unpickled pitches are the shared one
+    def __reduce__(self):
+        return (pitch, (self.exact_degree,))
+
+    # in scale degrees
+    def transpose(self, degrees):
+        return pitch(self.exact_degree + degrees)
+
+# PITCHES[exact_degree], 0 isn't a pitch
+PITCHES = [None] + [Pitch(exact_degree) for exact_degree in range(1, 50)]
+PITCHES_BY_STRING = dict((p.degree_octave_str, p) for p in PITCHES[1:])
+
+def pitch(exact_degree):
+    if exact_degree < 1 or exact_degree > 49:
+        raise NameError("Invalid degree or octave: %d,%d" % ((exact_degree - 1) % 7 + 1, (exact_degree - 1) / 7 + 1))
+    return PITCHES[exact_degree]
+
+# "1,5" (the duration dashes of a note string are ignored)
+def pitch_from_string(string):
+    if not PITCHES_BY_STRING.has_key(string[:3]):
+        raise NameError("Invalid degree or octave: %s" % string[:3])
+    return PITCHES_BY_STRING[string[:3]]
 
 class Note:
     def __init__(self, *args, **kwargs):
         if len(args) != 0:
             raise NameError("Invalid use of NoteIK")
         if kwargs.has_key('string'):
-            self.degree = int(kwargs['string'][0])
-            self.octave = int(kwargs['string'][2])
+            self.set_pitch(pitch_from_string(kwargs['string']))
             self.duration = len(kwargs['string']) - 2
         elif kwargs.has_key('exact_degree'):
-            self.degree = (kwargs['exact_degree'] - 1) % 7 + 1
-            self.octave = (kwargs['exact_degree'] - 1) / 7 + 1
+            self.set_pitch(pitch(kwargs['exact_degree']))
             self.duration = kwargs.get('duration', 1)
         elif kwargs.has_key('degree') and kwargs.has_key('octave'):
             self.degree = kwargs['degree']
             self.octave = kwargs['octave']
             self.duration = kwargs.get('duration', 1)
+            self.on_change()
         else:
             raise NameError("Invalid use of Note()")
         self.location = None
-        self.on_change()
-    # called anytime this note's value changed
+    # called anytime this note's degree or octave were changed directly
     def on_change(self):
         if self.degree < 1 or self.degree > 7 or self.octave < 1 or self.octave > 7:
             raise NameError("Invalid degree or octave: %d,%d" % (self.degree, self.octave))
-        self.exact_degree = self.degree + 7 * (self.octave - 1)
-        self.degree_octave_str = str(self.degree) + ',' + str(self.octave)
-        self.name = name_from_degree(self.degree)
-        self.name_with_octave = self.name + str(self.octave)
+        self.set_pitch(PITCHES[self.degree + 7 * (self.octave - 1)])
+    def set_pitch(self, p):
+        self.pitch = p
+        self.degree = p.degree
+        self.octave = p.octave
+        self.exact_degree = p.exact_degree
+        self.degree_octave_str = p.degree_octave_str
+        self.name = p.name
+        self.name_with_octave = p.name_with_octave
     # in scale degrees
     def transpose(self, degrees, in_place=True):
+        p = pitch(self.degree + 7 * (self.octave - 1) + degrees)
         if in_place:
-            self.degree += degrees
-            while self.degree < 1:
-                self.degree += 7
-                self.octave -= 1
-            while self.degree > 7:
-                self.degree -= 7
-                self.octave += 1
-            self.on_change()
+            self.set_pitch(p)
         else:
-            ret = Note(degree=self.degree, octave=self.octave)
-            ret.transpose(degrees)
-            return ret
+            return Note(exact_degree=p.exact_degree)
     def get_music21(self):
-        ret = music21.note.Note(name_from_degree(self.degree) + str(self.octave))
+        music21 = notation.music21()
+        ret = music21.note.Note(self.name_with_octave)
         ret.quarterLength = 0.5 * self.duration
         return ret
     # OVERLOADED OPERATORS
@@ -100,6 +147,7 @@ class Rest:
         self.duration = duration
         self.location = None
     def get_music21(self):
+        music21 = notation.music21()
         ret = music21.note.Rest()
         ret.quarterLength = 0.5 * self.duration
         return ret
@@ -112,8 +160,7 @@ class Extension:
 def name_from_degree(degree):
     if degree < 1 or degree > 7:
         raise NameError("Invalid degree.")
-    names = ['C', 'D', 'E', 'F', 'G', 'A', 'B']
-    return names[degree - 1]
+    return NAMES[degree - 1]
 
 # positive indications that note2 is higher than note1
 def degree_separation(note1, note2):
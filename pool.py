@@ -0,0 +1,68 @@
+# pool.py
+
+# process pool for creating and scoring the offspring of the genetic algorithm on several cores
+# every child gets its own seed, drawn from the master seed in the parent process, and is mutated right after
+# seeding its worker's random module with it, so a run depends only on the master seed and not on how many workers
+# there are or which worker gets which child
+# the pool is started the first time it's needed and kept (across generations and calls to genetic_algorithm) until
+# close() is called or a pool with a different number of workers is asked for
+
+import multiprocessing
+import random
+
+MAX_SEED = 2**31 - 1
+
+_pool = None
+_workers = 0
+
+def get(workers):
+    global _pool, _workers
+    if _pool is not None and _workers != workers:
+        close()
+    if _pool is None:
+        _pool = multiprocessing.Pool(workers)
+        _workers = workers
+    return _pool
+
+def close():
+    global _pool, _workers
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+    _pool = None
+    _workers = 0
+
+# seeds for num_offspring children, drawn from rng (a random.Random)
+def child_seeds(rng, num_offspring):
+    return [rng.randint(0, MAX_SEED) for i in range(num_offspring)]
+
+# creates and scores the children of parent for the given seeds on the pool against target (a melody.CompiledTarget)
+# returns the best of them and its distance if it's closer than bound, (None, bound) otherwise
+# ties go to the first child, the same one a single process would pick
+def best_offspring(pool, workers, parent, target, bound, seeds):
+    chunk = (len(seeds) + workers - 1) // workers
+    tasks = [(parent, target, bound, seeds[i:i + chunk]) for i in range(0, len(seeds), chunk)]
+    best = None
+    for child, distance in pool.map(_best_of_chunk, tasks):
+        if child is not None and bound > distance:
+            best = child
+            bound = distance
+    return best, bound
+
+# the children of parent for the given seeds, each mutated right after seeding the random module with its seed
+# (genetic_algorithm uses this directly when it's given a master seed but no workers)
+def seeded_children(parent, seeds):
+    ret = []
+    for s in seeds:
+        random.seed(s)
+        ret.append(parent.mutate())
+    return ret
+
+# runs in the workers
+def _best_of_chunk(task):
+    parent, target, bound, seeds = task
+    children = seeded_children(parent, seeds)
+    i, distance = target.best(children, bound)
+    if i is None:
+        return None, None
+    return children[i], distance
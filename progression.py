@@ -3,9 +3,18 @@
 # 12/26/15
 
 import csv
+from collections import OrderedDict
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+import random
 from random import randint
-import music21
+import numpy
 import chord
+import pool
+import notation
 
 GLOBAL_ROOT = None
 
@@ -23,11 +32,23 @@ class Progression:
         for c in self.p:
             strings.append(c.numeral)
         return '-'.join(strings)
+    # the CompiledProgression for this progression, shared by every progression with the same chords while it's one of
+    # the MAX_COMPILED most recently used
+    def compile(self):
+        key = str(self)
+        ret = COMPILED.pop(key, None)
+        if ret is None:
+            ret = CompiledProgression(self)
+            if len(COMPILED) >= MAX_COMPILED:
+                COMPILED.popitem(last=False)
+        COMPILED[key] = ret
+        return ret
     def chord_at(self, tick):
         CHORD_DURATION = 8
         progression_duration = CHORD_DURATION * len(self.p)
         return self.p[(tick % progression_duration) / CHORD_DURATION]
     def get_music21(self, duration):
+        music21 = notation.music21()
         ret = music21.stream.Part()
         ret.insert(music21.instrument.Piano())
         while ret.quarterLength * 2 < duration:
@@ -38,132 +59,331 @@ class Progression:
         ret.insert(music21.dynamics.Dynamic('p'))
         return ret
 
+# a progression as lookup tables: the index (in chord.NUMERALS) of the chord on every tick of one pass through the
+# progression, and the dissonance of every degree against the chord on every tick
+class CompiledProgression:
+    def __init__(self, progression):
+        CHORD_DURATION = 8
+        self.period = numpy.array([chord.NUMERAL_INDEX[c.numeral] for c in progression.p for i in range(CHORD_DURATION)],
+                                  dtype=numpy.int32)
+        self.dissonance = chord.DISSONANCE_MATRIX[self.period] # row = tick, column = degree - 1
+
+    # chord index on every tick of a melody ticks long
+    def chord_indices(self, ticks):
+        return numpy.resize(self.period, ticks)
+
+    # sum over ticks of the dissonance of the sounding note against the chord times the duration of the note, the
+    # progression dissonance total of a melody, added up tick by tick in order
+    # pitches and durations are a melody's arrays, or 2d arrays with one row per melody (all the same length)
+    def dissonance_total(self, pitches, durations):
+        pitches = numpy.asarray(pitches, dtype=numpy.int32)
+        durations = numpy.asarray(durations)
+        ticks = pitches.shape[-1]
+        if ticks == 0:
+            return numpy.zeros(pitches.shape[:-1])
+        rows = numpy.resize(numpy.arange(len(self.period)), ticks)
+        values = numpy.where(pitches > 0, self.dissonance[rows, (pitches - 1) % 7] * durations, 0.0)
+        return numpy.cumsum(values, axis=-1)[..., -1]
+
+COMPILED = OrderedDict() # str(progression) -> CompiledProgression, least recently used first
+MAX_COMPILED = 1000
+
+# the decision tree of chord progressions, stored as a sparse trie
+# conceptually every node (a progression so far) has a branch for each viable chord and one for 'END', with
+# default_weight on every branch that's allowed (chords up to max_chords deep, END from min_chords deep) plus whatever
+# weight the training data added
+# only the nodes on trained paths exist, the weights of everything else are worked out from default_weight when
+# they're needed, so building and training cost as much as the data and not as much as the full tree
 class TreeNode:
-    def __init__(self, data):
-        self.children = []
-        self.data = data
+    def __init__(self):
+        self.children = {} # chord -> TreeNode
+        self.weights = {} # chord -> weight added by training
+        self.end = 0 # weight added to the END branch by training
 
-class TreeConnection:
-    def __init__(self, weight, to_node):
-        self.weight = weight
-        self.to_node = to_node
+class DecisionTree:
+    def __init__(self, min_chords, max_chords, default_weight, viable_chords):
+        self.min_chords = min_chords
+        self.max_chords = max_chords
+        self.default_weight = default_weight
+        self.viable_chords = viable_chords
+        self.viable = set(viable_chords)
+        self.root = TreeNode()
+        self.compiled = None
 
-def build_decision_tree(min_chords, max_chords, default_weight, viable_chords):
-    root = TreeNode('START')
-    temp = [root]
-    queue = []
-    for i in range(max_chords + 1):
-        for node in temp:
-            for chord in viable_chords:
-                newNode = TreeNode(chord)
-                queue.append(newNode)
-                if i == max_chords:
-                    node.children.append(TreeConnection(0, newNode))
+    # (chord or 'END', weight) for every branch of a node depth chords deep, in sampling order
+    # node is None if nothing below it was trained
+    # a node past max_chords (only reached by training a chord max_chords deep) still has every branch, but only END
+    # has any weight
+    def branches(self, node, depth):
+        if depth < self.max_chords:
+            chord_weight = self.default_weight
+        else:
+            chord_weight = 0
+        if depth >= self.min_chords:
+            end_weight = self.default_weight
+        else:
+            end_weight = 0
+        if node is None:
+            ret = [(c, chord_weight) for c in self.viable_chords]
+        else:
+            ret = [(c, chord_weight + node.weights.get(c, 0)) for c in self.viable_chords]
+            end_weight += node.end
+        ret.append(('END', end_weight))
+        return ret
+
+    # adds weight to every branch along a progression, chords that aren't viable (or are deeper than the tree) are
+    # skipped
+    def teach(self, chords, weight):
+        self.compiled = None
+        node = self.root
+        depth = 0
+        for c in chords:
+            if depth <= self.max_chords and c in self.viable:
+                node.weights[c] = node.weights.get(c, 0) + weight
+                if not node.children.has_key(c):
+                    node.children[c] = TreeNode()
+                node = node.children[c]
+                depth += 1
+        if depth <= self.max_chords:
+            node.end += weight
+
+    # walks from the root to END choosing branches in proportion to their weights (with the compiled tree, which is
+    # kept until the tree is taught something new)
+    def sample(self):
+        if self.compiled is None:
+            self.compiled = self.compile()
+        return self.compiled.sample()
+
+    def compile(self):
+        return CompiledDecisionTree(self)
+
+# a DecisionTree flattened into arrays for sampling and for saving to a file (see save_model), read only
+# the trained nodes are numbered breadth first from the root (node 0), every node has k + 1 cumulative branch weights
+# (k viable chords, then END) and k child node numbers (-1 for a branch with nothing trained below it)
+# untrained nodes only depend on their depth, their cumulative weights are kept once per depth
+class CompiledDecisionTree:
+    def __init__(self, tree=None):
+        if tree is None:
+            return
+        self.min_chords = tree.min_chords
+        self.max_chords = tree.max_chords
+        self.default_weight = tree.default_weight
+        self.chords = list(tree.viable_chords)
+        self.cumulative = array('I')
+        self.children = array('i')
+        nodes = [(tree.root, 0)]
+        i = 0
+        while i < len(nodes):
+            node, depth = nodes[i]
+            self.cumulative.extend(cumulative_weights(tree.branches(node, depth)))
+            for c in self.chords:
+                if node.children.has_key(c):
+                    self.children.append(len(nodes))
+                    nodes.append((node.children[c], depth + 1))
                 else:
-                    node.children.append(TreeConnection(default_weight, newNode))
-            if i >= min_chords:
-                node.children.append(TreeConnection(default_weight, TreeNode('END')))
+                    self.children.append(-1)
+            i += 1
+        self.build_defaults(tree)
+
+    def build_defaults(self, tree):
+        self.defaults = [cumulative_weights(tree.branches(None, depth)) for depth in range(self.max_chords + 2)]
+
+    # walks from the root to END, at every node one randint picks a branch in proportion to its weight, found by
+    # binary search in the node's cumulative weights
+    def sample(self):
+        k = len(self.chords)
+        cumulative = self.cumulative
+        children = self.children
+        ret = []
+        node = 0
+        depth = 0
+        while True:
+            if node >= 0:
+                weights = cumulative
+                base = node * (k + 1)
             else:
-                node.children.append(TreeConnection(0, TreeNode('END')))
-        temp = queue
-        queue = []
-    GLOBAL_ROOT = root
-    return root
+                weights = self.defaults[depth]
+                base = 0
+            total = weights[base + k]
+            if total == 1:
+                rand = 0
+            else:
+                rand = randint(0, total - 1)
+            i = bisect_right(weights, rand, base, base + k + 1) - base
+            if i == k:
+                return ret
+            ret.append(self.chords[i])
+            if node >= 0:
+                node = children[node * k + i]
+            depth += 1
+
+    # rebuilds the trainable tree, to teach it more and compile it again
+    def tree(self):
+        k = len(self.chords)
+        ret = DecisionTree(self.min_chords, self.max_chords, self.default_weight, self.chords)
+        nodes = [(ret.root, 0)]
+        i = 0
+        while i < len(nodes):
+            node, depth = nodes[i]
+            base = i * (k + 1)
+            previous = 0
+            for j, (c, weight) in enumerate(ret.branches(None, depth)):
+                trained = self.cumulative[base + j] - previous - weight
+                previous = self.cumulative[base + j]
+                if c == 'END':
+                    node.end = trained
+                elif trained != 0:
+                    node.weights[c] = trained
+            for j, c in enumerate(self.chords):
+                if self.children[i * k + j] >= 0:
+                    node.children[c] = TreeNode()
+                    nodes.append((node.children[c], depth + 1))
+            i += 1
+        return ret
+
+def cumulative_weights(branches):
+    ret = []
+    total = 0
+    for c, weight in branches:
+        total += weight
+        ret.append(total)
+    if total > MAX_MODEL_WEIGHT:
+        raise NameError("Progression weights are too large to compile.")
+    return ret
+
+# compiled model file:
+#   header: MODEL_MAGIC, min_chords, max_chords, default_weight, number of chords k, number of nodes n
+#   k chord names, each a length byte and then the name
+#   n * (k + 1) cumulative weights (unsigned 32 bit), then n * k child node numbers (signed 32 bit), little endian
+MODEL_MAGIC = 'PRG1'
+MODEL_HEADER = struct.Struct('<4sIIIII')
+MAX_MODEL_WEIGHT = 2**32 - 1
+
+def save_model(compiled, path):
+    f = open(path, 'wb')
+    f.write(MODEL_HEADER.pack(MODEL_MAGIC, compiled.min_chords, compiled.max_chords, compiled.default_weight,
+                              len(compiled.chords), len(compiled.cumulative) // (len(compiled.chords) + 1)))
+    for c in compiled.chords:
+        f.write(struct.pack('<B', len(c)) + c)
+    for values in [compiled.cumulative, compiled.children]:
+        values = array(values.typecode, values)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        f.write(values.tostring())
+    f.close()
 
-def print_tree(node, depth):
-    if len(node.children) == 0:
-        return
-    print("(%d:%s " % (depth, node.data)),
-    for connection in node.children:
-        print("%d-%s" % (connection.weight, connection.to_node.data)),
+# reads a file written by save_model in one go
+def load_model(path):
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    magic, min_chords, max_chords, default_weight, k, n = MODEL_HEADER.unpack_from(data, 0)
+    if magic != MODEL_MAGIC:
+        raise NameError("Not a progression model file: %s" % path)
+    ret = CompiledDecisionTree()
+    ret.min_chords = min_chords
+    ret.max_chords = max_chords
+    ret.default_weight = default_weight
+    ret.chords = []
+    offset = MODEL_HEADER.size
+    for i in range(k):
+        length = ord(data[offset])
+        ret.chords.append(data[offset + 1:offset + 1 + length])
+        offset += 1 + length
+    ret.cumulative = array('I')
+    ret.cumulative.fromstring(data[offset:offset + 4 * n * (k + 1)])
+    offset += 4 * n * (k + 1)
+    ret.children = array('i')
+    ret.children.fromstring(data[offset:offset + 4 * n * k])
+    if sys.byteorder == 'big':
+        ret.cumulative.byteswap()
+        ret.children.byteswap()
+    ret.build_defaults(DecisionTree(min_chords, max_chords, default_weight, ret.chords))
+    return ret
+
+def build_decision_tree(min_chords, max_chords, default_weight, viable_chords):
+    return DecisionTree(min_chords, max_chords, default_weight, viable_chords)
+
+# prints the trained nodes with the weights of all their branches
+def print_tree(tree, node=None, depth=0, path=None):
+    if node is None:
+        node = tree.root
+        path = ['START']
+    print("(%d:%s " % (depth, path[-1])),
+    for c, weight in tree.branches(node, depth):
+        print("%d-%s" % (weight, c)),
     print(")")
-    for connection in node.children:
-        print_tree(connection.to_node, depth + 1)
+    for c in tree.viable_chords:
+        if node.children.has_key(c):
+            print_tree(tree, node.children[c], depth + 1, path + [c])
 
-def teach_decision_tree(file, root):
+# streams a tab separated file of progressions (chords, then the weight) into the tree one line at a time, so the
+# file can be as big as needed
+def teach_decision_tree(file, tree):
     csvfile = open(file, 'rb')
     reader = csv.reader(csvfile, delimiter='\t')
     for line in reader:
-        temp = root
-        for chord in range(len(line) - 1):
-            for connection in temp.children:
-                if connection.to_node.data == line[chord]:
-                    connection.weight += int(line[len(line) - 1])
-                    temp = connection.to_node
-                    break
-        for connection in temp.children:
-            if connection.to_node.data == 'END':
-                connection.weight += int(line[len(line) - 1])
+        if len(line) < 2:
+            continue
+        tree.teach(line[:len(line) - 1], int(line[len(line) - 1]))
     csvfile.close()
 
-def create_progression(root, double_progession_chance):
-    temp = root
-    ret = []
-    while 1:
-        # base case
-        if temp.data == 'END':
-            break;
-        # find random number
-        total = 0
-        for connection in temp.children:
-            total += connection.weight
-        if total == 1:
-            rand = 0
-        else:
-            rand = randint(0, total - 1)
-        # choose chord based on random number
-        total = 0
-        for connection in temp.children:
-            total += connection.weight
-            if rand < total:
-                temp = connection.to_node
-                if temp.data != 'END':
-                    ret.append(temp.data)
-                break
+def create_progression(tree, double_progession_chance):
+    ret = tree.sample()
     #append a second progression if desired (common in many songs to have an 8-chord progression built from two 4 chord progressions)
     if (randint(0,100) / 100.0) < double_progession_chance:
-        ret2 = []
-        temp = root
-        while 1:
-            # base case
-            if temp.data == 'END':
-                break;
-            # find random number
-            total = 0
-            for connection in temp.children:
-                total += connection.weight
-            if total == 1:
-                rand = 0
-            else:
-                rand = randint(0, total - 1)
-            # choose chord based on random number
-            total = 0
-            for connection in temp.children:
-                total += connection.weight
-                if rand < total:
-                    temp = connection.to_node
-                    if temp.data != 'END':
-                        ret.append(temp.data)
-                    break
-        ret += ret2
+        ret += tree.sample()
     return ret
 
-def print_n_progressions(root, n):
-    dict = {}
+def print_n_progressions(tree, n, double_progession_chance=0.0):
+    counts = sample_progressions(tree, n, double_progession_chance=double_progession_chance)
+    for key in counts:
+        print("%d\t%s" % (counts[key], key))
+
+# dict of progression ('I-V-vi-IV') -> how many of n sampled progressions it was
+# with a seed the counts are reproducible (for the same number of workers), workers > 1 splits the sampling across
+# a process pool (see pool.py)
+def sample_progressions(tree, n, seed=None, double_progession_chance=0.0, workers=1):
+    if isinstance(tree, DecisionTree):
+        tree = tree.compile()
+    if workers <= 1:
+        return _count_progressions((tree, n, seed, double_progession_chance))
+    rng = random.Random(seed)
+    chunk = (n + workers - 1) // workers
+    tasks = []
+    for i in range(0, n, chunk):
+        tasks.append((tree, min(chunk, n - i), rng.randint(0, pool.MAX_SEED), double_progession_chance))
+    ret = {}
+    for counts in pool.get(workers).map(_count_progressions, tasks):
+        for key, value in counts.iteritems():
+            ret[key] = ret.get(key, 0) + value
+    return ret
+
+def _count_progressions(task):
+    tree, n, seed, double_progession_chance = task
+    if seed is not None:
+        random.seed(seed)
+    ret = {}
     for i in range(n):
-        progression = '-'.join(create_progression(root))
-        if dict.has_key(progression):
-            dict[progression] += 1
-        else:
-            dict[progression] = 1
-    for key in dict:
-        print("%d\t%s" % (dict[key], key))
+        progression = '-'.join(create_progression(tree, double_progession_chance))
+        ret[progression] = ret.get(progression, 0) + 1
+    return ret
 
 def std_initialization():
     root = build_decision_tree(2, 6, 1, ['I', 'ii', 'iii', 'III', 'IV', 'V', 'vi'])
     teach_decision_tree("progression_data.txt", root)
     return root
 
+# the standard model, compiled, from model_file if it's newer than the training data, otherwise trained from scratch
+# and saved there
+def compiled_initialization(model_file="progression_model.bin"):
+    DATA_FILE = "progression_data.txt"
+    if os.path.exists(model_file) and os.path.getmtime(model_file) >= os.path.getmtime(DATA_FILE):
+        return load_model(model_file)
+    ret = std_initialization().compile()
+    save_model(ret, model_file)
+    return ret
+
 def music21_chord_from_numeral(numeral):
     k = key.Key('C')
     ret = roman.RomanNumeral(numeral, k)
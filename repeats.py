@@ -0,0 +1,78 @@
+# repeats.py
+
+# counts repeated sequences of notes for the tonally thematic characteristic
+# the notes are given as integer pitch codes (exact degrees)
+# instead of hashing every sequence notes[i:j] (O(n^3)), a suffix array and its longest common prefix (lcp) array
+# are built and the repeated sequences are read off the lcp intervals: every interval with lcp L, whose enclosing
+# interval has lcp P, stands for the sequences of length P+1..L, each occurring once per suffix in the interval
+
+# number of times each sequence of 2 or more notes appears, summed over sequences that appear more than once and
+# are not just the same note repeated
+def repeated_sequences(codes):
+    n = len(codes)
+    if n < 2:
+        return 0.0
+    sa = suffix_array(codes)
+    lcp = lcp_array(codes, sa)
+
+    # run[i] is how many times codes[i] is repeated starting at i, sequences starting at i no longer than that are
+    # constant and don't count
+    run = [1] * n
+    for i in range(n - 2, -1, -1):
+        if codes[i] == codes[i + 1]:
+            run[i] = run[i + 1] + 1
+
+    total = 0
+    stack = [(0, 0)] # (lcp, left bound) of the open intervals
+    for i in range(1, n + 1):
+        if i < n:
+            cur = lcp[i]
+        else:
+            cur = 0
+        left = i - 1
+        while cur < stack[-1][0]:
+            length, left = stack.pop()
+            parent = max(cur, stack[-1][0])
+            total += (i - left) * max(0, length - max(parent, run[sa[left]], 1))
+        if cur > stack[-1][0]:
+            stack.append((cur, left))
+    return float(total)
+
+# prefix doubling, O(n log^2 n)
+def suffix_array(codes):
+    n = len(codes)
+    rank = list(codes)
+    sa = list(range(n))
+    k = 1
+    while True:
+        key = lambda i: (rank[i], rank[i + k] if i + k < n else -1)
+        sa.sort(key=key)
+        new_rank = [0] * n
+        for j in range(1, n):
+            new_rank[sa[j]] = new_rank[sa[j - 1]]
+            if key(sa[j]) != key(sa[j - 1]):
+                new_rank[sa[j]] += 1
+        rank = new_rank
+        if n == 0 or rank[sa[-1]] == n - 1:
+            return sa
+        k *= 2
+
+# kasai's algorithm, lcp[i] is the longest common prefix of suffixes sa[i - 1] and sa[i] (lcp[0] is 0)
+def lcp_array(codes, sa):
+    n = len(codes)
+    rank = [0] * n
+    for i in range(n):
+        rank[sa[i]] = i
+    lcp = [0] * n
+    h = 0
+    for i in range(n):
+        if rank[i] > 0:
+            j = sa[rank[i] - 1]
+            while i + h < n and j + h < n and codes[i + h] == codes[j + h]:
+                h += 1
+            lcp[rank[i]] = h
+            if h > 0:
+                h -= 1
+        else:
+            h = 0
+    return lcp
@@ -0,0 +1,104 @@
+# sidecar.py
+
+# characteristics of the melodies in a song folder, saved in a sidecar file (SIDECAR_NAME) in the folder so that
+# unchanged melodies don't have to be scored again
+# every entry is keyed by the file name and remembers the file's modification time and the md5 of its contents, an
+# entry is only used if both still match, entries for files that are gone are dropped the next time the sidecar is
+# written
+# file layout (little endian): HEADER (magic, number of entries), then per entry: length of the file name (2 bytes),
+# the file name, ENTRY (modification time, md5, the characteristics in batch.KEYS order)
+
+import hashlib
+import os
+import struct
+import batch
+import pool
+
+SIDECAR_NAME = '.characteristics'
+MAGIC = 'CHR1'
+HEADER = struct.Struct('<4sI')
+NAME = struct.Struct('<H')
+ENTRY = struct.Struct('<d16s' + 'd' * len(batch.KEYS))
+MIN_PARALLEL_MISSES = 64 # fewer misses than this are scored in this process
+
+# fills in the characteristics of melodies loaded from folder (their IDs are their file names) from the sidecar,
+# scores the rest (on a process pool of workers if there are enough of them) and updates the sidecar
+def calculate_characteristics(folder, melodies, workers=1):
+    entries = read(folder)
+    fresh = {}
+    misses = []
+    for m in melodies:
+        path = os.path.join(folder, m.ID)
+        key = (os.path.getmtime(path), file_hash(path))
+        entry = entries.get(m.ID)
+        if entry is not None and entry[0] == key:
+            for name, value in zip(batch.KEYS, entry[1]):
+                m.characteristics[name] = value
+        else:
+            misses.append(m)
+        fresh[m.ID] = key
+    if workers > 1 and len(misses) >= MIN_PARALLEL_MISSES:
+        chunk = (len(misses) + workers - 1) // workers
+        chunks = [misses[i:i + chunk] for i in range(0, len(misses), chunk)]
+        results = pool.get(workers).map(_characteristics_of, chunks)
+        for ms, characteristics in zip(chunks, results):
+            for m, values in zip(ms, characteristics):
+                m.characteristics.update(values)
+    else:
+        batch.calculate_characteristics(misses)
+    # files that weren't loaded this time keep their entries while they exist, they're checked when they're loaded
+    updated = {}
+    for ID, entry in entries.iteritems():
+        if os.path.exists(os.path.join(folder, ID)):
+            updated[ID] = entry
+    for m in melodies:
+        updated[m.ID] = (fresh[m.ID], [m.characteristics[name] for name in batch.KEYS])
+    if updated != entries:
+        write(folder, updated)
+
+def file_hash(path):
+    f = open(path, 'rb')
+    ret = hashlib.md5(f.read()).digest()
+    f.close()
+    return ret
+
+# file name -> ((modification time, md5), characteristic values in batch.KEYS order)
+def read(folder):
+    ret = {}
+    path = os.path.join(folder, SIDECAR_NAME)
+    if not os.path.exists(path):
+        return ret
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    if len(data) < HEADER.size:
+        return ret
+    magic, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        return ret
+    offset = HEADER.size
+    for i in range(count):
+        length = NAME.unpack_from(data, offset)[0]
+        offset += NAME.size
+        name = data[offset:offset + length]
+        offset += length
+        values = ENTRY.unpack_from(data, offset)
+        offset += ENTRY.size
+        ret[name] = ((values[0], values[1]), list(values[2:]))
+    return ret
+
+# written to a temporary file first so that a crash never leaves half a sidecar
+def write(folder, entries):
+    path = os.path.join(folder, SIDECAR_NAME)
+    f = open(path + '.tmp', 'wb')
+    f.write(HEADER.pack(MAGIC, len(entries)))
+    for name in sorted(entries.keys()):
+        (mtime, digest), values = entries[name]
+        f.write(NAME.pack(len(name)) + name + ENTRY.pack(mtime, digest, *values))
+    f.close()
+    os.rename(path + '.tmp', path)
+
+# runs in the workers
+def _characteristics_of(melodies):
+    batch.calculate_characteristics(melodies)
+    return [m.characteristics for m in melodies]